@@ -1,41 +1,49 @@
 import datetime as dt
-import io
 import asyncio
-import os
-from typing import Any
-from zoneinfo import ZoneInfo
+import re
+import tempfile
+import time
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Callable
 
-from html import escape as _h
 from aiogram import F, Router
-from aiogram.filters import Command
+from aiogram.filters import BaseFilter, Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import CallbackQuery, Message, FSInputFile
-from aiogram.types import BufferedInputFile
+from aiogram.types import BufferedInputFile, InlineKeyboardMarkup, InputFile
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
 from aiogram.types import InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo
+from aiogram.utils.text_decorations import html_decoration
 from openpyxl import Workbook
 from sqlalchemy import func, select
 
 from bot.config import Settings
 from bot.db import (
+    AppSettingsSnapshot,
     Post,
     Progress,
     Response,
     TaskRun,
     User,
     count_posts,
+    data_version,
     create_post,
     delete_post,
-    get_app_settings,
+    get_telegram_ids_page,
+    get_app_settings_cached,
     get_or_create_progress,
     get_post,
     get_responses_for_user,
     get_user_by_telegram_id,
-    list_posts,
+    get_user_id_by_telegram_id,
+    list_posts_page,
     move_post,
     delete_task_runs_for_user,
+    reset_all_progress,
     reset_progress,
+    run_db,
     set_user_admin_flag,
     set_greeting_text,
     set_greeting_media,
@@ -47,6 +55,9 @@ from bot.db import (
     update_post,
 )
 from bot.keyboards import (
+    AdminListCB,
+    AdminMoveCB,
+    AdminPostCB,
     admin_edit_post_kb,
     admin_broadcast_confirm_kb,
     admins_menu_kb,
@@ -56,51 +67,125 @@ from bot.keyboards import (
     admin_cancel_greeting_final_kb,
     admin_cancel_menu_kb,
 )
+from bot.images import default_image_path
+from bot.text_utils import escape_html as _h
 
+PAGE_SIZE = 8
+
+def _is_admin(user_id: int | None, settings: Settings) -> bool:
+    return user_id is not None and user_id in settings.admin_ids
+
+
+class AdminFilter(BaseFilter):
+    async def __call__(self, event: Message | CallbackQuery, settings: Settings) -> bool:
+        return _is_admin(event.from_user.id if event.from_user else None, settings)
+
+
+# Router-level filter: non-admin updates never reach any admin handler.
 admin_router = Router()
+admin_router.message.filter(AdminFilter())
+admin_router.callback_query.filter(AdminFilter())
 
-PAGE_SIZE = 8
+# Included after admin_router: admin buttons pressed by non-admins get an alert.
+admin_denied_router = Router()
 
 
-def _is_admin(user_id: int | None, settings: Settings) -> bool:
-    return bool(user_id) and int(user_id) in settings.admin_ids
+@admin_denied_router.callback_query(F.data.startswith("admin:"))
+async def admin_denied(call: CallbackQuery, settings: Settings):
+    if _is_admin(call.from_user.id if call.from_user else None, settings):
+        # Stale/unknown admin button: just stop the spinner.
+        await call.answer()
+        return
+    await call.answer("Нет доступа", show_alert=True)
 
 
 def _tznow(settings: Settings) -> dt.datetime:
     # Store/compare all timestamps as tz-naive "local time" in settings.tz
-    return dt.datetime.now(ZoneInfo(settings.tz)).replace(tzinfo=None)
+    return dt.datetime.now(settings.tzinfo).replace(tzinfo=None)
+
+
+def _load_admin_menu_data(db, *, telegram_id: int) -> tuple[Progress, int]:
+    # One round-trip: admin user + progress + posts count.
+    row = db.execute(
+        select(User, Progress, select(func.count()).select_from(Post).scalar_subquery())
+        .outerjoin(Progress, Progress.user_id == User.id)
+        .where(User.telegram_id == telegram_id)
+    ).first()
+    if row:
+        u, prog, total_posts = row
+    else:
+        u, prog = upsert_user(db, telegram_id=telegram_id), None
+        set_user_admin_flag(db, telegram_id=telegram_id, is_admin=True)
+        total_posts = count_posts(db)
+    # Ensure progress always exists for admins menu (never show "нет")
+    if prog is None:
+        now = dt.datetime.now().replace(second=0, microsecond=0)
+        prog = get_or_create_progress(db, user_id=u.id, next_send_at=now)
+    elif prog.next_send_at and (prog.next_send_at.second or prog.next_send_at.microsecond):
+        # Same minute-precision normalisation get_or_create_progress applies to existing rows.
+        prog.next_send_at = prog.next_send_at.replace(second=0, microsecond=0)
+        prog.updated_at = dt.datetime.now()
+        db.commit()
+    return prog, total_posts
+
+
+_MENU_TMPL = (
+    "<b>Админ-меню</b>\n\n"
+    "⏱ Окно ответа: <b>{rw} мин</b>\n"
+    "⏲ Интервал рассылки: <b>{si} мин</b>\n\n"
+    "<b>Постов в БД</b>: <b>{n}</b>\n\n"
+    "<b>Прогресс</b>\n{prog}"
+)
+
+
+def _fmt_prog(p: Progress | None) -> str:
+    if not p:
+        return "нет"
+    done = max(0, p.next_position - 1)
+    pending = f"pending_post_id={p.pending_post_id}" if p.pending_post_id else "pending=нет"
+    active = f"active_post_id={p.active_post_id} до {p.active_until}" if p.active_post_id else "active=нет"
+    return f"пройдено дней: <b>{done}</b>\n{pending}\n{active}\nnext_send_at: <code>{p.next_send_at}</code>"
+
+
+# telegram_id -> (fingerprint, rendered html, checked_at). The fingerprint is
+# (progress.updated_at, posts count, settings snapshot): every progress write
+# bumps updated_at, so a matching fingerprint means the text is unchanged.
+# Within MENU_CACHE_TTL_SECONDS of the last check even the fingerprint query is
+# skipped, as long as no post/progress write bumped data_version() meanwhile.
+MENU_CACHE_TTL_SECONDS = 2.0
+_MENU_CACHE: dict[int, tuple[tuple, str, float, int]] = {}
+
+
+def _load_admin_menu_fingerprint(db, *, telegram_id: int) -> tuple[dt.datetime, int] | None:
+    row = db.execute(
+        select(Progress.updated_at, select(func.count()).select_from(Post).scalar_subquery())
+        .join(User, User.id == Progress.user_id)
+        .where(User.telegram_id == telegram_id)
+    ).first()
+    return tuple(row) if row else None
 
 
 async def _render_admin_menu_text(*, telegram_id: int, session_factory) -> str:
-    db = session_factory()
-    try:
-        s = get_app_settings(db)
-        u = db.scalar(select(User).where(User.telegram_id == telegram_id))
-        if not u:
-            u = upsert_user(db, telegram_id=telegram_id)
-            set_user_admin_flag(db, telegram_id=telegram_id, is_admin=True)
-        # Ensure progress always exists for admins menu (never show "нет")
-        now = dt.datetime.now().replace(second=0, microsecond=0)
-        prog = get_or_create_progress(db, user_id=u.id, next_send_at=now)
-        total_posts = count_posts(db)
-    finally:
-        db.close()
-
-    def _fmt_prog(p: Progress | None) -> str:
-        if not p:
-            return "нет"
-        done = max(0, p.next_position - 1)
-        pending = f"pending_post_id={p.pending_post_id}" if p.pending_post_id else "pending=нет"
-        active = f"active_post_id={p.active_post_id} до {p.active_until}" if p.active_post_id else "active=нет"
-        return f"пройдено дней: <b>{done}</b>\n{pending}\n{active}\nnext_send_at: <code>{p.next_send_at}</code>"
-
-    return (
-        "<b>Админ-меню</b>\n\n"
-        f"⏱ Окно ответа: <b>{s.response_window_minutes} мин</b>\n"
-        f"⏲ Интервал рассылки: <b>{s.send_interval_minutes} мин</b>\n\n"
-        f"<b>Постов в БД</b>: <b>{total_posts}</b>\n\n"
-        "<b>Прогресс</b>\n" + _fmt_prog(prog)
+    s = await get_app_settings_cached(session_factory)
+    cached = _MENU_CACHE.get(telegram_id)
+    now = time.monotonic()
+    ver = data_version()
+    if cached and cached[0][2] == s and cached[3] == ver and now - cached[2] < MENU_CACHE_TTL_SECONDS:
+        return cached[1]
+    fp = await run_db(session_factory, _load_admin_menu_fingerprint, telegram_id=telegram_id)
+    if fp is not None and cached and cached[0] == (*fp, s):
+        _MENU_CACHE[telegram_id] = (cached[0], cached[1], now, ver)
+        return cached[1]
+    prog, total_posts = await run_db(session_factory, _load_admin_menu_data, telegram_id=telegram_id)
+
+    text = _MENU_TMPL.format(
+        rw=s.response_window_minutes,
+        si=s.send_interval_minutes,
+        n=total_posts,
+        prog=_fmt_prog(prog),
     )
+    _MENU_CACHE[telegram_id] = ((prog.updated_at, total_posts, s), text, now, ver)
+    return text
 
 
 class AdminEditFSM(StatesGroup):
@@ -122,7 +207,39 @@ class AdminBroadcastFSM(StatesGroup):
     content = State()
 
 
-_ALBUM_BUFFER: dict[tuple[int, str], list[Message]] = {}
+# Max recipients a broadcast talks to at once (Telegram allows ~30 msg/s per bot).
+BROADCAST_CONCURRENCY = 25
+BROADCAST_PAGE_SIZE = 1000
+BROADCAST_RATE_PER_SECOND = 28.0
+
+
+class _RateLimiter:
+    """
+    Spaces entries at most `rate` per second across all callers (no lock needed on one event loop).
+    """
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate
+        self._next = 0.0
+
+    async def __aenter__(self) -> None:
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self._interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def __aexit__(self, *exc) -> bool:
+        return False
+
+
+# Shared by all broadcasts so concurrent ones still respect the bot-wide limit.
+_BROADCAST_LIMITER = _RateLimiter(BROADCAST_RATE_PER_SECOND)
+
+# Album parts collected per (chat_id, media_group_id) until no new part arrives for ALBUM_QUIET_SECONDS.
+# Only (message_id, media item) pairs are buffered, not whole Message objects.
+ALBUM_QUIET_SECONDS = 1.2
+_ALBUM_BUFFER: dict[tuple[int, str], dict[str, Any]] = {}
 _ALBUM_TASKS: dict[tuple[int, str], asyncio.Task] = {}
 
 
@@ -139,38 +256,57 @@ def _extract_album_media(m: Message) -> dict[str, Any] | None:
     return None
 
 
-async def _finalize_album_draft(*, key: tuple[int, str], state: FSMContext, chat_id: int) -> None:
-    await asyncio.sleep(1.2)  # debounce: wait for the whole media_group
-    msgs = _ALBUM_BUFFER.pop(key, [])
+async def _finalize_album_draft(*, key: tuple[int, str], state: FSMContext, bot, chat_id: int) -> None:
+    # debounce: every new part pushes the deadline back, so wait until it stops moving
+    buf = _ALBUM_BUFFER[key]
+    while (left := buf["deadline"] - time.monotonic()) > 0:
+        await asyncio.sleep(left)
+    _ALBUM_BUFFER.pop(key, None)
     _ALBUM_TASKS.pop(key, None)
-    if not msgs:
+    parts = buf["parts"]
+    if not parts:
         return
 
     # preserve original order by message_id
-    msgs.sort(key=lambda x: x.message_id)
-
-    media_items: list[dict[str, Any]] = []
-    message_ids: list[int] = []
-    for m in msgs:
-        message_ids.append(m.message_id)
-        item = _extract_album_media(m)
-        if item:
-            media_items.append(item)
+    parts.sort(key=itemgetter(0))
+    message_ids = [mid for mid, _ in parts]
+    media_items = [item for _, item in parts if item]
 
     await state.update_data(
         broadcast_draft={
             "kind": "album",
-            "from_chat_id": int(chat_id),
+            "from_chat_id": chat_id,
             "message_ids": message_ids,
             "media": media_items,
         }
     )
 
-    await msgs[-1].answer(
+    await bot.send_message(
+        chat_id,
         "✅ Альбом получен.\n\nОтправить всем пользователям?",
         reply_markup=admin_broadcast_confirm_kb(),
     )
 
+
+async def _enter_state(state: FSMContext, new_state: State, **data: Any) -> None:
+    # Same result as clear() + set_state() + update_data(), in two storage writes instead of 3-4.
+    await state.set_state(new_state)
+    await state.set_data(data)
+
+
+def _extract_html(message: Message) -> str:
+    # html_text re-renders every entity; plain text only needs escaping.
+    if message.entities or message.caption_entities:
+        return message.html_text
+    return html_decoration.quote(message.text or message.caption or "")
+
+
+async def _awaited(method):
+    # Bot API method objects are awaitable but unhashable pydantic models, which
+    # asyncio.gather() rejects; wrap them in a coroutine first.
+    return await method
+
+
 async def _smart_edit(call: CallbackQuery, text: str, reply_markup=None, disable_web_page_preview: bool = True):
     """
     Helper to edit a message even if it was a photo message (by deleting and resending).
@@ -190,26 +326,18 @@ async def _smart_edit(call: CallbackQuery, text: str, reply_markup=None, disable
 
 
 async def _render_list(call: CallbackQuery, *, page: int, session_factory) -> None:
-    db = session_factory()
-    try:
-        total = count_posts(db)
-        posts = list_posts(db, limit=PAGE_SIZE, offset=page * PAGE_SIZE)
-        items = [(p.id, p.position, p.title) for p in posts]
-    finally:
-        db.close()
+    total, items = await run_db(session_factory, list_posts_page, limit=PAGE_SIZE, offset=page * PAGE_SIZE)
 
     await _smart_edit(
         call,
         f"Посты (всего: <b>{total}</b>):",
-        reply_markup=admins_posts_list_kb(posts=items, page=page, page_size=PAGE_SIZE, total=total),
+        reply_markup=admins_posts_list_kb(posts=tuple(items), page=page, page_size=PAGE_SIZE, total=total),
     )
 
 
 @admin_router.message(Command("admins"))
 @admin_router.message(Command("admin"))
 async def cmd_admins(message: Message, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(message.from_user.id if message.from_user else None, settings):
-        return
     await state.clear()
     text = await _render_admin_menu_text(telegram_id=message.from_user.id, session_factory=session_factory)
     await message.answer(text, reply_markup=admins_menu_kb())
@@ -217,8 +345,6 @@ async def cmd_admins(message: Message, settings: Settings, state: FSMContext, se
 
 @admin_router.message(Command("cancel"))
 async def cmd_cancel(message: Message, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(message.from_user.id if message.from_user else None, settings):
-        return
     await state.clear()
     text = await _render_admin_menu_text(telegram_id=message.from_user.id, session_factory=session_factory)
     await message.answer("Отменено.\n\n" + text, reply_markup=admins_menu_kb())
@@ -226,136 +352,79 @@ async def cmd_cancel(message: Message, settings: Settings, state: FSMContext, se
 
 @admin_router.callback_query(F.data == "admin:menu")
 async def admin_menu(call: CallbackQuery, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(call.from_user.id if call.from_user else None, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
     await state.clear()
     text = await _render_admin_menu_text(telegram_id=call.from_user.id, session_factory=session_factory)
-    await _smart_edit(call, text, reply_markup=admins_menu_kb())
-    await call.answer()
+    await asyncio.gather(_smart_edit(call, text, reply_markup=admins_menu_kb()), _awaited(call.answer()))
 
 
 @admin_router.callback_query(F.data == "noop")
 async def noop(call: CallbackQuery):
     await call.answer()
 
-@admin_router.callback_query(F.data == "admin:greeting")
-async def admin_greeting(call: CallbackQuery, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(call.from_user.id if call.from_user else None, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
-    db = session_factory()
-    try:
-        s = get_app_settings(db)
-        current = s.greeting_text
-    finally:
-        db.close()
-    await state.clear()
-    await state.set_state(AdminEditFSM.greeting)
-    await call.message.answer(
-        "<b>Приветствие</b>\n\nТекущее:\n"
-        f"{_h(current)}\n\n"
-        "Пришлите новый текст приветствия:",
-        disable_web_page_preview=True,
-        reply_markup=admin_cancel_greeting_final_kb(),
-    )
-    await call.answer()
-
-
-@admin_router.callback_query(F.data == "admin:greeting_media")
-async def admin_greeting_media(call: CallbackQuery, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(call.from_user.id if call.from_user else None, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
-    db = session_factory()
-    try:
-        s = get_app_settings(db)
-        current = s.greeting_media_type or "нет"
-    finally:
-        db.close()
-    await state.clear()
-    await state.set_state(AdminEditFSM.greeting_media)
-    await call.message.answer(
-        "<b>Приветствие: картинка</b>\n\n"
-        f"Текущее медиа: <b>{_h(current)}</b>\n\n"
-        "Пришлите <b>картинку</b> (photo) или текст <code>remove</code>, чтобы убрать:",
-        disable_web_page_preview=True,
-        reply_markup=admin_cancel_greeting_final_kb(),
-    )
-    await call.answer()
-
-
-@admin_router.callback_query(F.data == "admin:final")
-async def admin_final_text(call: CallbackQuery, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(call.from_user.id if call.from_user else None, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
-    db = session_factory()
-    try:
-        s = get_app_settings(db)
-        current = s.final_text or ""
-    finally:
-        db.close()
-    await state.clear()
-    await state.set_state(AdminEditFSM.final_text)
-    await call.message.answer(
-        "<b>Финальное сообщение</b>\n\nТекущее:\n"
-        f"{_h(current)}\n\n"
-        "Пришлите новый текст финального сообщения:",
-        disable_web_page_preview=True,
-        reply_markup=admin_cancel_greeting_final_kb(),
-    )
-    await call.answer()
-
-
-@admin_router.callback_query(F.data == "admin:final_media")
-async def admin_final_media(call: CallbackQuery, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(call.from_user.id if call.from_user else None, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
-    db = session_factory()
-    try:
-        s = get_app_settings(db)
-        current = s.final_media_type or "нет"
-    finally:
-        db.close()
-    await state.clear()
-    await state.set_state(AdminEditFSM.final_media)
-    await call.message.answer(
-        "<b>Финал: картинка</b>\n\n"
-        f"Текущее медиа: <b>{_h(current)}</b>\n\n"
-        "Пришлите <b>картинку</b> (photo) или текст <code>remove</code>, чтобы убрать:",
-        disable_web_page_preview=True,
-        reply_markup=admin_cancel_greeting_final_kb(),
-    )
-    await call.answer()
-
-
-@admin_router.callback_query(F.data == "admin:resp_window")
-async def admin_resp_window(call: CallbackQuery, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(call.from_user.id if call.from_user else None, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
-    db = session_factory()
-    try:
-        s = get_app_settings(db)
-        current = s.response_window_minutes
-    finally:
-        db.close()
-    await state.clear()
-    await state.set_state(AdminEditFSM.response_window)
-    await call.message.answer(
-        f"Текущее окно ответа: <b>{current} мин</b>\n\n"
-        "Пришлите новое значение (целое число минут, минимум 1):",
-        reply_markup=admin_cancel_menu_kb(),
-    )
+# callback data -> (state, prompt built from the current settings snapshot, cancel keyboard)
+_SETTINGS_PROMPTS: dict[str, tuple[State, Callable[[AppSettingsSnapshot], str], Callable[[], InlineKeyboardMarkup]]] = {
+    "admin:greeting": (
+        AdminEditFSM.greeting,
+        lambda s: f"<b>Приветствие</b>\n\nТекущее:\n{_h(s.greeting_text)}\n\nПришлите новый текст приветствия:",
+        admin_cancel_greeting_final_kb,
+    ),
+    "admin:greeting_media": (
+        AdminEditFSM.greeting_media,
+        lambda s: (
+            "<b>Приветствие: картинка</b>\n\n"
+            f"Текущее медиа: <b>{_h(s.greeting_media_type or 'нет')}</b>\n\n"
+            "Пришлите <b>картинку</b> (photo) или текст <code>remove</code>, чтобы убрать:"
+        ),
+        admin_cancel_greeting_final_kb,
+    ),
+    "admin:final": (
+        AdminEditFSM.final_text,
+        lambda s: (
+            "<b>Финальное сообщение</b>\n\nТекущее:\n"
+            f"{_h(s.final_text or '')}\n\n"
+            "Пришлите новый текст финального сообщения:"
+        ),
+        admin_cancel_greeting_final_kb,
+    ),
+    "admin:final_media": (
+        AdminEditFSM.final_media,
+        lambda s: (
+            "<b>Финал: картинка</b>\n\n"
+            f"Текущее медиа: <b>{_h(s.final_media_type or 'нет')}</b>\n\n"
+            "Пришлите <b>картинку</b> (photo) или текст <code>remove</code>, чтобы убрать:"
+        ),
+        admin_cancel_greeting_final_kb,
+    ),
+    "admin:resp_window": (
+        AdminEditFSM.response_window,
+        lambda s: (
+            f"Текущее окно ответа: <b>{s.response_window_minutes} мин</b>\n\n"
+            "Пришлите новое значение (целое число минут, минимум 1):"
+        ),
+        admin_cancel_menu_kb,
+    ),
+    "admin:send_interval": (
+        AdminEditFSM.send_interval,
+        lambda s: (
+            f"Текущий интервал рассылки: <b>{s.send_interval_minutes} мин</b>\n\n"
+            "Пришлите новое значение (целое число минут, минимум 1):"
+        ),
+        admin_cancel_menu_kb,
+    ),
+}
+
+
+@admin_router.callback_query(F.data.in_(_SETTINGS_PROMPTS))
+async def admin_settings_prompt(call: CallbackQuery, settings: Settings, state: FSMContext, session_factory):
+    edit_state, build_prompt, cancel_kb = _SETTINGS_PROMPTS[call.data]
+    s = await get_app_settings_cached(session_factory)
+    await _enter_state(state, edit_state)
+    await call.message.answer(build_prompt(s), disable_web_page_preview=True, reply_markup=cancel_kb())
     await call.answer()
 
 
 @admin_router.message(AdminEditFSM.response_window)
 async def admin_save_resp_window(message: Message, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(message.from_user.id if message.from_user else None, settings):
-        return
     raw = (message.text or "").strip()
     try:
         minutes = int(raw)
@@ -367,54 +436,24 @@ async def admin_save_resp_window(message: Message, settings: Settings, state: FS
             disable_web_page_preview=True,
         )
         return
-    db = session_factory()
-    try:
-        s = set_response_window_minutes(db, minutes=minutes)
-        current = s.response_window_minutes
-    finally:
-        db.close()
+    s = await run_db(session_factory, set_response_window_minutes, minutes=minutes)
+    current = s.response_window_minutes
     await state.clear()
     await message.answer(f"✅ Окно ответа установлено: <b>{current} мин</b>", reply_markup=admins_menu_kb())
 
 
-@admin_router.callback_query(F.data == "admin:send_interval")
-async def admin_send_interval(call: CallbackQuery, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(call.from_user.id if call.from_user else None, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
-    db = session_factory()
-    try:
-        s = get_app_settings(db)
-        current = s.send_interval_minutes
-    finally:
-        db.close()
-    await state.clear()
-    await state.set_state(AdminEditFSM.send_interval)
-    await call.message.answer(
-        f"Текущий интервал рассылки: <b>{current} мин</b>\n\n"
-        "Пришлите новое значение (целое число минут, минимум 1):",
-        reply_markup=admin_cancel_menu_kb(),
-    )
-    await call.answer()
-
-
 @admin_router.callback_query(F.data == "admin:greeting_final")
 async def admin_greeting_final(call: CallbackQuery, settings: Settings, state: FSMContext):
-    if not _is_admin(call.from_user.id if call.from_user else None, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
     await state.clear()
-    await _smart_edit(call, "<b>Приветствие / Финал</b>\n\nВыберите, что редактировать:", reply_markup=admin_greeting_final_kb())
-    await call.answer()
+    await asyncio.gather(
+        _smart_edit(call, "<b>Приветствие / Финал</b>\n\nВыберите, что редактировать:", reply_markup=admin_greeting_final_kb()),
+        _awaited(call.answer()),
+    )
 
 
 @admin_router.callback_query(F.data == "admin:broadcast:start")
 async def admin_broadcast_start(call: CallbackQuery, settings: Settings, state: FSMContext):
-    if not _is_admin(call.from_user.id if call.from_user else None, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
-    await state.clear()
-    await state.set_state(AdminBroadcastFSM.content)
+    await _enter_state(state, AdminBroadcastFSM.content)
     await call.message.answer(
         "<b>Рассылка всем</b>\n\n"
         "Пришлите сообщение для рассылки (текст/фото/ГС/док/стикер/альбом).\n"
@@ -427,38 +466,38 @@ async def admin_broadcast_start(call: CallbackQuery, settings: Settings, state:
 
 @admin_router.callback_query(F.data == "admin:broadcast:cancel")
 async def admin_broadcast_cancel(call: CallbackQuery, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(call.from_user.id if call.from_user else None, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
     await state.clear()
     text = await _render_admin_menu_text(telegram_id=call.from_user.id, session_factory=session_factory)
-    await _smart_edit(call, "❌ Отменено.\n\n" + text, reply_markup=admins_menu_kb())
-    await call.answer()
+    await asyncio.gather(_smart_edit(call, "❌ Отменено.\n\n" + text, reply_markup=admins_menu_kb()), _awaited(call.answer()))
 
 
 @admin_router.message(AdminBroadcastFSM.content)
 async def admin_broadcast_capture(message: Message, settings: Settings, state: FSMContext):
-    if not _is_admin(message.from_user.id if message.from_user else None, settings):
-        return
 
     # Album (media group)
     if message.media_group_id:
-        key = (int(message.chat.id), str(message.media_group_id))
-        _ALBUM_BUFFER.setdefault(key, []).append(message)
-
-        # debounce finalize task
-        t = _ALBUM_TASKS.get(key)
-        if t and not t.done():
-            t.cancel()
-        _ALBUM_TASKS[key] = asyncio.create_task(_finalize_album_draft(key=key, state=state, chat_id=int(message.chat.id)))
+        key = (message.chat.id, message.media_group_id)
+        deadline = time.monotonic() + ALBUM_QUIET_SECONDS
+        part = (message.message_id, _extract_album_media(message))
+        buf = _ALBUM_BUFFER.get(key)
+        if buf is not None:
+            buf["parts"].append(part)
+            buf["deadline"] = deadline
+            return
+
+        # one finalize task per album; later parts only extend its deadline
+        _ALBUM_BUFFER[key] = {"parts": [part], "deadline": deadline}
+        _ALBUM_TASKS[key] = asyncio.create_task(
+            _finalize_album_draft(key=key, state=state, bot=message.bot, chat_id=message.chat.id)
+        )
         return
 
     # Single message draft: use copy_message later (supports voice, sticker, etc.)
     await state.update_data(
         broadcast_draft={
             "kind": "single",
-            "from_chat_id": int(message.chat.id),
-            "message_id": int(message.message_id),
+            "from_chat_id": message.chat.id,
+            "message_id": message.message_id,
         }
     )
     await message.answer(
@@ -469,9 +508,6 @@ async def admin_broadcast_capture(message: Message, settings: Settings, state: F
 
 @admin_router.callback_query(F.data == "admin:broadcast:send")
 async def admin_broadcast_send(call: CallbackQuery, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(call.from_user.id if call.from_user else None, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
 
     data = await state.get_data()
     draft = data.get("broadcast_draft")
@@ -479,12 +515,6 @@ async def admin_broadcast_send(call: CallbackQuery, settings: Settings, state: F
         await call.answer("Нечего отправлять. Сначала пришлите сообщение.", show_alert=True)
         return
 
-    db = session_factory()
-    try:
-        tg_ids = [int(x) for x in db.scalars(select(User.telegram_id)).all()]
-    finally:
-        db.close()
-
     await call.answer("Начинаю рассылку…")
 
     delivered = 0
@@ -494,12 +524,34 @@ async def admin_broadcast_send(call: CallbackQuery, settings: Settings, state: F
     async def _copy(to_chat_id: int, from_chat_id: int, msg_id: int) -> None:
         nonlocal delivered, failed
         try:
-            await bot.copy_message(chat_id=to_chat_id, from_chat_id=from_chat_id, message_id=msg_id)
+            async with _BROADCAST_LIMITER:
+                await bot.copy_message(chat_id=to_chat_id, from_chat_id=from_chat_id, message_id=msg_id)
             delivered += 1
         except TelegramRetryAfter as e:
             await asyncio.sleep(float(getattr(e, "retry_after", 1)) + 0.5)
             try:
-                await bot.copy_message(chat_id=to_chat_id, from_chat_id=from_chat_id, message_id=msg_id)
+                async with _BROADCAST_LIMITER:
+                    await bot.copy_message(chat_id=to_chat_id, from_chat_id=from_chat_id, message_id=msg_id)
+                delivered += 1
+            except Exception:
+                failed += 1
+        except (TelegramForbiddenError, TelegramBadRequest, TelegramNetworkError):
+            failed += 1
+        except Exception:
+            failed += 1
+
+    async def _copy_many(to_chat_id: int, from_chat_id: int, msg_ids: list[int]) -> None:
+        # One copyMessages call per recipient; Telegram keeps album parts grouped.
+        nonlocal delivered, failed
+        try:
+            async with _BROADCAST_LIMITER:
+                await bot.copy_messages(chat_id=to_chat_id, from_chat_id=from_chat_id, message_ids=msg_ids)
+            delivered += 1
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(float(getattr(e, "retry_after", 1)) + 0.5)
+            try:
+                async with _BROADCAST_LIMITER:
+                    await bot.copy_messages(chat_id=to_chat_id, from_chat_id=from_chat_id, message_ids=msg_ids)
                 delivered += 1
             except Exception:
                 failed += 1
@@ -530,13 +582,15 @@ async def admin_broadcast_send(call: CallbackQuery, settings: Settings, state: F
                     ims.append(InputMediaAudio(media=fid, caption=cap))
             if len(ims) < 2:
                 return False
-            await bot.send_media_group(chat_id=to_chat_id, media=ims)
+            async with _BROADCAST_LIMITER:
+                await bot.send_media_group(chat_id=to_chat_id, media=ims)
             delivered += 1
             return True
         except TelegramRetryAfter as e:
             await asyncio.sleep(float(getattr(e, "retry_after", 1)) + 0.5)
             try:
-                await bot.send_media_group(chat_id=to_chat_id, media=ims)  # type: ignore[name-defined]
+                async with _BROADCAST_LIMITER:
+                    await bot.send_media_group(chat_id=to_chat_id, media=ims)  # type: ignore[name-defined]
                 delivered += 1
                 return True
             except Exception:
@@ -551,20 +605,32 @@ async def admin_broadcast_send(call: CallbackQuery, settings: Settings, state: F
 
     kind = draft.get("kind")
     from_chat_id = int(draft.get("from_chat_id") or 0)
-
-    for tg_id in tg_ids:
-        if kind == "single":
-            await _copy(int(tg_id), from_chat_id, int(draft.get("message_id")))
-        elif kind == "album":
-            media = draft.get("media") or []
-            if isinstance(media, list) and await _send_album(int(tg_id), media):
-                pass
-            else:
-                # fallback: copy each message from original album
-                for mid in (draft.get("message_ids") or []):
-                    await _copy(int(tg_id), from_chat_id, int(mid))
-                    await asyncio.sleep(0.05)
-        await asyncio.sleep(0.05)
+    sem = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    album_ids = sorted(int(mid) for mid in (draft.get("message_ids") or []))
+    single_id = int(draft.get("message_id") or 0)
+
+    async def _deliver(tg_id: int) -> None:
+        # A RetryAfter only stalls the recipient that hit it; the others keep going.
+        async with sem:
+            if kind == "single":
+                await _copy(tg_id, from_chat_id, single_id)
+            elif kind == "album":
+                media = draft.get("media") or []
+                if isinstance(media, list) and await _send_album(tg_id, media):
+                    pass
+                elif album_ids:
+                    # fallback: copy the original album messages in one call
+                    await _copy_many(tg_id, from_chat_id, album_ids)
+
+    # Recipients are read in keyset pages; the next page loads while the current one is being sent.
+    def _next_page(after_user_id: int):
+        return run_db(session_factory, get_telegram_ids_page, after_user_id=after_user_id, limit=BROADCAST_PAGE_SIZE)
+
+    page = await _next_page(0)
+    while page:
+        prefetch = asyncio.create_task(_next_page(page[-1][0])) if len(page) == BROADCAST_PAGE_SIZE else None
+        await asyncio.gather(*(_deliver(tg_id) for _, tg_id in page), return_exceptions=True)
+        page = await prefetch if prefetch is not None else []
 
     await state.clear()
     await call.message.answer(f"✅ Рассылка завершена.\nДоставлено: <b>{delivered}</b>\nОшибок: <b>{failed}</b>")
@@ -572,153 +638,196 @@ async def admin_broadcast_send(call: CallbackQuery, settings: Settings, state: F
     await call.message.answer(text, reply_markup=admins_menu_kb())
 
 
+def _load_summary_items(db, *, telegram_id: int) -> list[tuple[Post, list[Response]]] | None:
+    u = get_user_by_telegram_id(db, telegram_id)
+    if not u:
+        return None
+    return get_responses_for_user(db, user_id=u.id)
+
+
 @admin_router.callback_query(F.data == "admin:summary:me")
 async def admin_summary_me(call: CallbackQuery, settings: Settings, session_factory):
-    if not _is_admin(call.from_user.id if call.from_user else None, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
 
-    db = session_factory()
-    try:
-        u = get_user_by_telegram_id(db, call.from_user.id)
-        if not u:
-            await call.answer("Пользователь не найден", show_alert=True)
-            return
-        items = get_responses_for_user(db, user_id=u.id)
-    finally:
-        db.close()
+    items = await run_db(session_factory, _load_summary_items, telegram_id=call.from_user.id)
+    if items is None:
+        await call.answer("Пользователь не найден", show_alert=True)
+        return
 
     if not items:
-        await call.message.answer("Пока нет заданий или ответов.")
-        await call.answer()
+        await asyncio.gather(_awaited(call.message.answer("Пока нет заданий или ответов.")), _awaited(call.answer()))
         return
 
-    await call.message.answer("<b>Ваша сводка ответов</b>", disable_web_page_preview=True)
+    # One document instead of one message per day: ~30 API calls -> 1.
+    parts: list[str] = []
     for post, responses in items:
-        full = f"<b>День {post.position}. {_h(post.title)}</b>\n\n"
+        parts.append(f"День {post.position}. {(post.title or '').strip()}\n\nОтвет(ы):\n")
         if responses:
-            full += "<b>Ответ(ы):</b>\n"
-            for r in responses:
-                full += f"- {_h(r.text)}\n"
+            parts.extend(f"- {(r.text or '').strip()}\n" for r in responses)
         else:
-            full += "<b>Ответ(ы):</b>\n- —\n"
+            parts.append("- —\n")
+        parts.append("\n")
+    data = "".join(parts).encode("utf-8")
+    filename = f"summary_{dt.datetime.now().strftime('%Y-%m-%d_%H-%M')}.txt"
+    # The callback answer doesn't depend on the upload; don't keep the button spinning behind it.
+    await asyncio.gather(
+        _awaited(call.message.answer_document(BufferedInputFile(data, filename=filename), caption="<b>Ваша сводка ответов</b>")),
+        _awaited(call.answer()),
+    )
+
+
+EXPORT_SPOOL_MAX_BYTES = 8 * 1024 * 1024
 
-        if len(full) <= 500:
-            await call.message.answer(full, disable_web_page_preview=True)
+# Usernames shown in the export; refreshed from get_chat at most once an hour per user.
+USERNAME_CACHE_TTL_SECONDS = 3600.0
+USERNAME_FETCH_ATTEMPTS = 3
+_USERNAME_CACHE: dict[int, tuple[str, float]] = {}
+_USERNAME_SEM = asyncio.Semaphore(20)
+
+
+async def _get_username(bot, telegram_id: int) -> str:
+    hit = _USERNAME_CACHE.get(telegram_id)
+    if hit is not None and time.monotonic() - hit[1] < USERNAME_CACHE_TTL_SECONDS:
+        return hit[0]
+    for attempt in range(USERNAME_FETCH_ATTEMPTS):
+        try:
+            # Same bot-wide pacing as broadcasts, so a big export doesn't run into 429s.
+            async with _USERNAME_SEM, _BROADCAST_LIMITER:
+                chat = await bot.get_chat(telegram_id)
+        except TelegramRetryAfter as e:
+            if attempt + 1 < USERNAME_FETCH_ATTEMPTS:
+                await asyncio.sleep(float(e.retry_after) + 0.5)
+            continue
+        except (TelegramBadRequest, TelegramForbiddenError):
+            # Chat not found / bot blocked: a definite "no username", cached like one.
+            username = ""
+        except Exception:
+            # Network hiccup etc.: leave the cell empty for this export, but don't cache it.
+            return ""
         else:
-            short = full[:499].rstrip() + "…"
-            # In admin menu we don't need callbacks; send full as file to preserve data
-            await call.message.answer(short, disable_web_page_preview=True)
-            data = full.replace("<b>", "").replace("</b>", "")
-            buf = BufferedInputFile(data.encode("utf-8"), filename=f"day_{post.position}.txt")
-            await call.message.answer_document(buf, caption=f"День {post.position}. {_h(post.title)}")
-    await call.answer()
+            username = f"@{chat.username}" if chat.username else ""
+        _USERNAME_CACHE[telegram_id] = (username, time.monotonic())
+        return username
+    return ""
+
+
+class _FileObjInputFile(InputFile):
+    """
+    Upload from an open binary file object (e.g. a SpooledTemporaryFile), chunk by chunk.
+    """
+
+    def __init__(self, file, filename: str):
+        super().__init__(filename=filename)
+        self._file = file
+
+    async def read(self, bot):
+        # A spooled file may have rolled over to disk: keep that I/O off the event loop.
+        await asyncio.to_thread(self._file.seek, 0)
+        while chunk := await asyncio.to_thread(self._file.read, self.chunk_size):
+            yield chunk
+
+
+_CRLF_RE = re.compile(r"\r\n?")
 
 
 def _truncate_excel_cell(s: str, limit: int = 32000) -> str:
-    s = (s or "").replace("\r\n", "\n").replace("\r", "\n")
+    s = _CRLF_RE.sub("\n", s or "")
     if len(s) <= limit:
         return s
     return s[: max(0, limit - 1)].rstrip() + "…"
 
 
-@admin_router.callback_query(F.data == "admin:export:xlsx")
-async def admin_export_all_summaries_xlsx(call: CallbackQuery, settings: Settings, session_factory):
-    if not _is_admin(call.from_user.id if call.from_user else None, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
-
-    await call.answer("Готовлю Excel…")
-
-    db = session_factory()
-    try:
-        posts = list(db.scalars(select(Post).order_by(Post.position.asc(), Post.id.asc())))
-        users = list(db.scalars(select(User).order_by(User.id.asc(), User.telegram_id.asc())))
-
-        # Latest run per (user, post) by started_at
-        latest = (
-            select(
-                TaskRun.user_id.label("user_id"),
-                TaskRun.post_id.label("post_id"),
-                func.max(TaskRun.started_at).label("max_started_at"),
-            )
-            .group_by(TaskRun.user_id, TaskRun.post_id)
-            .subquery()
-        )
-        latest_runs = (
-            select(TaskRun.id.label("run_id"), TaskRun.user_id.label("user_id"), TaskRun.post_id.label("post_id"))
-            .join(
-                latest,
-                (TaskRun.user_id == latest.c.user_id)
-                & (TaskRun.post_id == latest.c.post_id)
-                & (TaskRun.started_at == latest.c.max_started_at),
+def _load_export_data(db):
+    # Plain rows with just the exported columns; no ORM objects to hydrate.
+    posts = db.execute(select(Post.id, Post.position, Post.title).order_by(Post.position.asc(), Post.id.asc())).all()
+    users = db.execute(
+        select(User.id, User.telegram_id, User.full_name, User.region, User.email, User.onboarded_at)
+        .order_by(User.id.asc(), User.telegram_id.asc())
+    ).all()
+
+    # Latest run per (user, post) by started_at (ties -> higher id), picked in the same query as its responses.
+    ranked = (
+        select(
+            TaskRun.id.label("run_id"),
+            TaskRun.user_id.label("user_id"),
+            TaskRun.post_id.label("post_id"),
+            func.row_number()
+            .over(
+                partition_by=(TaskRun.user_id, TaskRun.post_id),
+                order_by=(TaskRun.started_at.desc(), TaskRun.id.desc()),
             )
-            .subquery()
+            .label("rn"),
         )
+        .subquery()
+    )
 
-        rows = db.execute(
-            select(latest_runs.c.user_id, latest_runs.c.post_id, Response.seq, Response.text)
-            .join(Response, Response.run_id == latest_runs.c.run_id)
-            .order_by(latest_runs.c.user_id.asc(), latest_runs.c.post_id.asc(), Response.seq.asc(), Response.id.asc())
-        ).all()
-    finally:
-        db.close()
-
-    answers: dict[tuple[int, int], list[str]] = {}
-    for user_id, post_id, _seq, text in rows:
-        answers.setdefault((int(user_id), int(post_id)), []).append(text or "")
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "summaries"
-
-    headers = [
-        "telegram_id",
-        "username",
-        "full_name",
-        "region",
-        "email",
-        "onboarded_at",
-    ] + [f"День {p.position}. {p.title}" for p in posts]
-    ws.append(headers)
-
-    for u in users:
-        username = ""
-        try:
-            chat = await call.bot.get_chat(int(u.telegram_id))
-            if getattr(chat, "username", None):
-                username = f"@{chat.username}"
-        except Exception:
-            username = ""
+    # Ordered by (user, post) so the export can consume it in one merge pass.
+    rows = db.execute(
+        select(ranked.c.user_id, ranked.c.post_id, Response.text)
+        .join(Response, Response.run_id == ranked.c.run_id)
+        .where(ranked.c.rn == 1)
+        .order_by(ranked.c.user_id.asc(), ranked.c.post_id.asc(), Response.seq.asc(), Response.id.asc())
+    ).all()
+    return posts, users, rows
+
+
+def _build_xlsx(posts, users, rows, usernames: list[str], out) -> None:
+    # write_only streams rows to the sheet XML instead of keeping a Cell per value.
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("summaries")
+    ws.freeze_panes = "A2"
 
+    user_headers = ("telegram_id", "username", "full_name", "region", "email", "onboarded_at")
+    ws.append([*user_headers, *(f"День {p.position}. {p.title}" for p in posts)])
+
+    # Answer cells go straight into the row, after the fixed user columns.
+    col_of = {p.id: len(user_headers) + i for i, p in enumerate(posts)}
+    blank = ("",) * len(posts)
+    by_user = groupby(rows, key=itemgetter(0))
+    pending = next(by_user, None)
+
+    for u, username in zip(users, usernames):
         row: list[object] = [
-            int(u.telegram_id),
+            u.telegram_id,
             username,
-            (getattr(u, "full_name", None) or ""),
-            (getattr(u, "region", None) or ""),
-            (getattr(u, "email", None) or ""),
-            getattr(u, "onboarded_at", None) or "",
+            u.full_name or "",
+            u.region or "",
+            u.email or "",
+            u.onboarded_at or "",
+            *blank,
         ]
-        for p in posts:
-            parts = answers.get((int(u.id), int(p.id)), [])
-            cell = "\n".join([s.strip() for s in parts if (s or "").strip()])
-            row.append(_truncate_excel_cell(cell))
+        uid = u.id
+        while pending is not None and pending[0] < uid:
+            pending = next(by_user, None)
+        if pending is not None and pending[0] == uid:
+            for post_id, group in groupby(pending[1], key=itemgetter(1)):
+                col = col_of.get(post_id)
+                if col is not None:
+                    row[col] = _truncate_excel_cell("\n".join(s for s in (t.strip() for _, _, t in group) if s))
+            pending = next(by_user, None)
         ws.append(row)
 
-    ws.freeze_panes = "A2"
-
-    out = io.BytesIO()
     wb.save(out)
-    out.seek(0)
+
+
+@admin_router.callback_query(F.data == "admin:export:xlsx")
+async def admin_export_all_summaries_xlsx(call: CallbackQuery, settings: Settings, session_factory):
+
+    await call.answer("Готовлю Excel…")
+
+    posts, users, rows = await run_db(session_factory, _load_export_data)
+    usernames = await asyncio.gather(*(_get_username(call.bot, u.telegram_id) for u in users))
 
     filename = f"summaries_{dt.datetime.now().strftime('%Y-%m-%d_%H-%M')}.xlsx"
-    await call.message.answer_document(BufferedInputFile(out.getvalue(), filename=filename))
+    # Small exports stay in RAM, big ones spill to disk; either way the upload
+    # reads the file in chunks instead of copying it into one bytes object.
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES) as out:
+        # Building and serialising the workbook is CPU-bound; keep it off the event loop.
+        await asyncio.to_thread(_build_xlsx, posts, users, rows, usernames, out)
+        await call.message.answer_document(_FileObjInputFile(out, filename=filename))
 
 
 @admin_router.message(AdminEditFSM.send_interval)
 async def admin_save_send_interval(message: Message, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(message.from_user.id if message.from_user else None, settings):
-        return
     raw = (message.text or "").strip()
     try:
         minutes = int(raw)
@@ -730,36 +839,24 @@ async def admin_save_send_interval(message: Message, settings: Settings, state:
             disable_web_page_preview=True,
         )
         return
-    db = session_factory()
-    try:
-        s = set_send_interval_minutes(db, minutes=minutes)
-        current = s.send_interval_minutes
-    finally:
-        db.close()
+    s = await run_db(session_factory, set_send_interval_minutes, minutes=minutes)
+    current = s.send_interval_minutes
     await state.clear()
     await message.answer(f"✅ Интервал рассылки установлен: <b>{current} мин</b>", reply_markup=admins_menu_kb())
 
 @admin_router.message(AdminEditFSM.greeting)
 async def admin_save_greeting(message: Message, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(message.from_user.id if message.from_user else None, settings):
-        return
-    txt = message.html_text or message.text or ""
+    txt = _extract_html(message)
     if not txt.strip():
         await message.answer("Текст пустой. Пришлите ещё раз:")
         return
-    db = session_factory()
-    try:
-        set_greeting_text(db, text=txt)
-    finally:
-        db.close()
+    await run_db(session_factory, set_greeting_text, text=txt)
     await state.clear()
     await message.answer("✅ Приветствие обновлено.", reply_markup=admins_menu_kb())
 
 
 @admin_router.message(AdminEditFSM.greeting_media)
 async def admin_save_greeting_media(message: Message, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(message.from_user.id if message.from_user else None, settings):
-        return
     raw = (message.text or "").strip().lower()
     media_type = None
     file_id = None
@@ -775,36 +872,24 @@ async def admin_save_greeting_media(message: Message, settings: Settings, state:
             reply_markup=admin_cancel_greeting_final_kb(),
         )
         return
-    db = session_factory()
-    try:
-        set_greeting_media(db, media_type=media_type, file_id=file_id)
-    finally:
-        db.close()
+    await run_db(session_factory, set_greeting_media, media_type=media_type, file_id=file_id)
     await state.clear()
     await message.answer("✅ Картинка для приветствия обновлена.", reply_markup=admins_menu_kb())
 
 
 @admin_router.message(AdminEditFSM.final_text)
 async def admin_save_final_text(message: Message, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(message.from_user.id if message.from_user else None, settings):
-        return
-    txt = message.html_text or message.text or ""
+    txt = _extract_html(message)
     if not txt.strip():
         await message.answer("Текст пустой. Пришлите ещё раз:")
         return
-    db = session_factory()
-    try:
-        set_final_text(db, text=txt)
-    finally:
-        db.close()
+    await run_db(session_factory, set_final_text, text=txt)
     await state.clear()
     await message.answer("✅ Финальное сообщение обновлено.", reply_markup=admins_menu_kb())
 
 
 @admin_router.message(AdminEditFSM.final_media)
 async def admin_save_final_media(message: Message, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(message.from_user.id if message.from_user else None, settings):
-        return
     raw = (message.text or "").strip().lower()
     media_type = None
     file_id = None
@@ -820,72 +905,38 @@ async def admin_save_final_media(message: Message, settings: Settings, state: FS
             reply_markup=admin_cancel_greeting_final_kb(),
         )
         return
-    db = session_factory()
-    try:
-        set_final_media(db, media_type=media_type, file_id=file_id)
-    finally:
-        db.close()
+    await run_db(session_factory, set_final_media, media_type=media_type, file_id=file_id)
     await state.clear()
     await message.answer("✅ Картинка для финала обновлена.", reply_markup=admins_menu_kb())
 
 
-@admin_router.callback_query(F.data.startswith("admin:list:"))
-async def admin_list_posts(call: CallbackQuery, settings: Settings, session_factory):
-    if not _is_admin(call.from_user.id, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
-    _pfx, _cmd, page_s = call.data.split(":", 2)
-    page = int(page_s)
-    await _render_list(call, page=page, session_factory=session_factory)
-    await call.answer()
+@admin_router.callback_query(AdminListCB.filter(F.cmd == "list"))
+async def admin_list_posts(call: CallbackQuery, callback_data: AdminListCB, settings: Settings, session_factory):
+    await asyncio.gather(_render_list(call, page=callback_data.page, session_factory=session_factory), _awaited(call.answer()))
 
 
-@admin_router.callback_query(F.data.startswith("admin:move:"))
-async def admin_move_post(call: CallbackQuery, settings: Settings, session_factory):
-    if not _is_admin(call.from_user.id, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
-    _pfx, _cmd, direction, post_id_s, page_s = call.data.split(":", 4)
-    post_id = int(post_id_s)
-    page = int(page_s)
-    db = session_factory()
-    try:
-        ok = move_post(db, post_id=post_id, direction=direction)
-    finally:
-        db.close()
-    await call.answer("Готово" if ok else "Нельзя", show_alert=False)
-    await _render_list(call, page=page, session_factory=session_factory)
+@admin_router.callback_query(AdminMoveCB.filter(F.cmd == "move"))
+async def admin_move_post(call: CallbackQuery, callback_data: AdminMoveCB, settings: Settings, session_factory):
+    ok = await run_db(session_factory, move_post, post_id=callback_data.post_id, direction=callback_data.direction)
+    await asyncio.gather(
+        _awaited(call.answer("Готово" if ok else "Нельзя", show_alert=False)),
+        _render_list(call, page=callback_data.page, session_factory=session_factory),
+    )
 
 
-@admin_router.callback_query(F.data.startswith("admin:del:"))
-async def admin_delete_post(call: CallbackQuery, settings: Settings, session_factory):
-    if not _is_admin(call.from_user.id, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
-    _pfx, _cmd, post_id_s, page_s = call.data.split(":", 3)
-    post_id = int(post_id_s)
-    db = session_factory()
-    try:
-        ok = delete_post(db, post_id)
-    finally:
-        db.close()
-    await call.answer("Удалено" if ok else "Не найдено")
-    await _render_list(call, page=int(page_s), session_factory=session_factory)
+@admin_router.callback_query(AdminPostCB.filter(F.cmd == "del"))
+async def admin_delete_post(call: CallbackQuery, callback_data: AdminPostCB, settings: Settings, session_factory):
+    ok = await run_db(session_factory, delete_post, callback_data.post_id)
+    await asyncio.gather(
+        _awaited(call.answer("Удалено" if ok else "Не найдено")),
+        _render_list(call, page=callback_data.page, session_factory=session_factory),
+    )
 
 
-@admin_router.callback_query(F.data.startswith("admin:edit:"))
-async def admin_open_post(call: CallbackQuery, settings: Settings, session_factory):
-    if not _is_admin(call.from_user.id, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
-    _pfx, _cmd, post_id_s, page_s = call.data.split(":", 3)
-    post_id = int(post_id_s)
-    page = int(page_s)
-    db = session_factory()
-    try:
-        post = get_post(db, post_id)
-    finally:
-        db.close()
+@admin_router.callback_query(AdminPostCB.filter(F.cmd == "edit"))
+async def admin_open_post(call: CallbackQuery, callback_data: AdminPostCB, settings: Settings, session_factory):
+    page = callback_data.page
+    post = await run_db(session_factory, get_post, callback_data.post_id)
     if not post:
         await call.answer("Пост не найден", show_alert=True)
         return
@@ -895,8 +946,8 @@ async def admin_open_post(call: CallbackQuery, settings: Settings, session_facto
     if post.file_id:
         media = post.file_id
     else:
-        local_path = f"data/images/{post.position}.png"
-        if os.path.exists(local_path):
+        local_path = default_image_path(post.position)
+        if local_path:
             media = FSInputFile(local_path)
             media_info = f"default ({post.position}.png)"
 
@@ -913,96 +964,53 @@ async def admin_open_post(call: CallbackQuery, settings: Settings, session_facto
             await call.message.delete()
         except Exception:
             pass
-        await call.message.answer_photo(photo=media, caption=body, reply_markup=kb)
+        await asyncio.gather(_awaited(call.message.answer_photo(photo=media, caption=body, reply_markup=kb)), _awaited(call.answer()))
     else:
-        await _smart_edit(call, body, reply_markup=kb)
-    await call.answer()
+        await asyncio.gather(_smart_edit(call, body, reply_markup=kb), _awaited(call.answer()))
 
 
-@admin_router.callback_query(F.data.startswith("admin:edit_title:"))
-async def admin_edit_title(call: CallbackQuery, settings: Settings, state: FSMContext):
-    if not _is_admin(call.from_user.id, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
-    _pfx, _cmd, post_id_s, page_s = call.data.split(":", 3)
-    await state.clear()
-    await state.set_state(AdminEditFSM.title)
-    await state.update_data(post_id=int(post_id_s), page=int(page_s))
-    await call.message.answer(
-        "Введите новое <b>название</b> (без «День X.»):",
-        reply_markup=admin_cancel_edit_post_kb(post_id=int(post_id_s), page=int(page_s)),
-    )
-    await call.answer()
-
-
-@admin_router.callback_query(F.data.startswith("admin:edit_text:"))
-async def admin_edit_text(call: CallbackQuery, settings: Settings, state: FSMContext):
-    if not _is_admin(call.from_user.id, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
-    _pfx, _cmd, post_id_s, page_s = call.data.split(":", 3)
-    await state.clear()
-    await state.set_state(AdminEditFSM.text)
-    await state.update_data(post_id=int(post_id_s), page=int(page_s))
-    await call.message.answer(
-        "Пришлите новый <b>текст</b> (HTML-разметка Telegram допустима):",
-        reply_markup=admin_cancel_edit_post_kb(post_id=int(post_id_s), page=int(page_s)),
-    )
-    await call.answer()
+# AdminPostCB cmd -> (FSM state, prompt) for the per-field post edit buttons.
+_EDIT_PROMPTS: dict[str, tuple[State, str]] = {
+    "edit_title": (AdminEditFSM.title, "Введите новое <b>название</b> (без «День X.»):"),
+    "edit_text": (AdminEditFSM.text, "Пришлите новый <b>текст</b> (HTML-разметка Telegram допустима):"),
+    "edit_media": (
+        AdminEditFSM.media,
+        "Пришлите <b>картинку</b> (photo) для поста или текст <code>remove</code>, чтобы убрать картинку:",
+    ),
+}
 
 
-@admin_router.callback_query(F.data.startswith("admin:edit_media:"))
-async def admin_edit_media(call: CallbackQuery, settings: Settings, state: FSMContext):
-    if not _is_admin(call.from_user.id, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
-    _pfx, _cmd, post_id_s, page_s = call.data.split(":", 3)
-    await state.clear()
-    await state.set_state(AdminEditFSM.media)
-    await state.update_data(post_id=int(post_id_s), page=int(page_s))
-    await call.message.answer(
-        "Пришлите <b>картинку</b> (photo) для поста или текст <code>remove</code>, чтобы убрать картинку:",
-        reply_markup=admin_cancel_edit_post_kb(post_id=int(post_id_s), page=int(page_s)),
-    )
+@admin_router.callback_query(AdminPostCB.filter(F.cmd.in_(_EDIT_PROMPTS)))
+async def admin_edit_field(call: CallbackQuery, callback_data: AdminPostCB, settings: Settings, state: FSMContext):
+    post_id, page = callback_data.post_id, callback_data.page
+    edit_state, prompt = _EDIT_PROMPTS[callback_data.cmd]
+    await _enter_state(state, edit_state, post_id=post_id, page=page)
+    await call.message.answer(prompt, reply_markup=admin_cancel_edit_post_kb(post_id=post_id, page=page))
     await call.answer()
 
 
 @admin_router.message(AdminEditFSM.title)
 async def admin_save_title(message: Message, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(message.from_user.id if message.from_user else None, settings):
-        return
     title = (message.text or "").strip()
     data = await state.get_data()
     post_id = int(data["post_id"])
-    db = session_factory()
-    try:
-        update_post(db, post_id, title=title)
-    finally:
-        db.close()
+    await run_db(session_factory, update_post, post_id, title=title)
     await state.clear()
     await message.answer("✅ Название обновлено.")
 
 
 @admin_router.message(AdminEditFSM.text)
 async def admin_save_text(message: Message, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(message.from_user.id if message.from_user else None, settings):
-        return
-    txt = message.html_text or message.text or ""
+    txt = _extract_html(message)
     data = await state.get_data()
     post_id = int(data["post_id"])
-    db = session_factory()
-    try:
-        update_post(db, post_id, text_html=txt)
-    finally:
-        db.close()
+    await run_db(session_factory, update_post, post_id, text_html=txt)
     await state.clear()
     await message.answer("✅ Текст обновлён.")
 
 
 @admin_router.message(AdminEditFSM.media)
 async def admin_save_media(message: Message, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(message.from_user.id if message.from_user else None, settings):
-        return
     data = await state.get_data()
     post_id = int(data["post_id"])
     page = int(data["page"])
@@ -1021,22 +1029,14 @@ async def admin_save_media(message: Message, settings: Settings, state: FSMConte
             reply_markup=admin_cancel_edit_post_kb(post_id=post_id, page=page),
         )
         return
-    db = session_factory()
-    try:
-        update_post(db, post_id, media_type=media_type, file_id=file_id)
-    finally:
-        db.close()
+    await run_db(session_factory, update_post, post_id, media_type=media_type, file_id=file_id)
     await state.clear()
     await message.answer("✅ Медиа обновлено.")
 
 
 @admin_router.callback_query(F.data == "admin:create")
 async def admin_create(call: CallbackQuery, settings: Settings, state: FSMContext):
-    if not _is_admin(call.from_user.id, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
-    await state.clear()
-    await state.set_state(AdminEditFSM.create_title)
+    await _enter_state(state, AdminEditFSM.create_title)
     await call.message.answer(
         "Введите <b>название</b> нового поста (без «День X.»):",
         reply_markup=admin_cancel_menu_kb(),
@@ -1046,8 +1046,6 @@ async def admin_create(call: CallbackQuery, settings: Settings, state: FSMContex
 
 @admin_router.message(AdminEditFSM.create_title)
 async def admin_create_title(message: Message, settings: Settings, state: FSMContext):
-    if not _is_admin(message.from_user.id if message.from_user else None, settings):
-        return
     title = (message.text or "").strip()
     if not title:
         await message.answer("Название не должно быть пустым.")
@@ -1059,9 +1057,7 @@ async def admin_create_title(message: Message, settings: Settings, state: FSMCon
 
 @admin_router.message(AdminEditFSM.create_text)
 async def admin_create_text(message: Message, settings: Settings, state: FSMContext):
-    if not _is_admin(message.from_user.id if message.from_user else None, settings):
-        return
-    txt = message.html_text or message.text or ""
+    txt = _extract_html(message)
     await state.update_data(create_text=txt)
     await state.set_state(AdminEditFSM.create_media)
     await message.answer("Пришлите <b>картинку</b> (photo) или напишите <code>skip</code>:", reply_markup=admin_cancel_menu_kb())
@@ -1069,8 +1065,6 @@ async def admin_create_text(message: Message, settings: Settings, state: FSMCont
 
 @admin_router.message(AdminEditFSM.create_media)
 async def admin_create_media(message: Message, settings: Settings, state: FSMContext, session_factory):
-    if not _is_admin(message.from_user.id if message.from_user else None, settings):
-        return
     data = await state.get_data()
     title = data["create_title"]
     text_html = data["create_text"]
@@ -1088,54 +1082,46 @@ async def admin_create_media(message: Message, settings: Settings, state: FSMCon
             reply_markup=admin_cancel_menu_kb(),
         )
         return
-    db = session_factory()
-    try:
-        post = create_post(db, title=title, text_html=text_html, media_type=media_type, file_id=file_id)
-    finally:
-        db.close()
+    post = await run_db(
+        session_factory, create_post, title=title, text_html=text_html, media_type=media_type, file_id=file_id
+    )
 
     await state.clear()
     await message.answer(f"✅ Создан пост: День {post.position}. {_h(post.title)}")
 
 
+def _reset_user(db, *, telegram_id: int, now: dt.datetime) -> bool:
+    user_id = get_user_id_by_telegram_id(db, telegram_id)
+    if user_id is None:
+        return False
+    delete_task_runs_for_user(db, user_id=user_id)
+    reset_progress(db, user_id=user_id, next_send_at=now)
+    return True
+
+
 @admin_router.callback_query(F.data == "admin:reset:me")
 async def admin_reset_me(call: CallbackQuery, settings: Settings, session_factory):
-    if not _is_admin(call.from_user.id, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
     now = _tznow(settings).replace(second=0, microsecond=0)
-    db = session_factory()
-    try:
-        u = db.scalar(select(User).where(User.telegram_id == call.from_user.id))
-        if not u:
-            await call.answer("Пользователь не найден", show_alert=True)
-            return
-        delete_task_runs_for_user(db, user_id=u.id)
-        reset_progress(db, user_id=u.id, next_send_at=now)
-    finally:
-        db.close()
-    await call.answer("Сброшено ✅", show_alert=True)
+    ok = await run_db(session_factory, _reset_user, telegram_id=call.from_user.id, now=now)
+    if not ok:
+        await call.answer("Пользователь не найден", show_alert=True)
+        return
     text = await _render_admin_menu_text(telegram_id=call.from_user.id, session_factory=session_factory)
-    await _smart_edit(call, text, reply_markup=admins_menu_kb())
+    await asyncio.gather(
+        _awaited(call.answer("Сброшено ✅", show_alert=True)),
+        _smart_edit(call, text, reply_markup=admins_menu_kb()),
+    )
 
 
 @admin_router.callback_query(F.data == "admin:reset:all")
 async def admin_reset_all(call: CallbackQuery, settings: Settings, session_factory):
-    if not _is_admin(call.from_user.id, settings):
-        await call.answer("Нет доступа", show_alert=True)
-        return
     now = _tznow(settings).replace(second=0, microsecond=0)
-    db = session_factory()
-    try:
-        users = list(db.scalars(select(User)))
-        for u in users:
-            delete_task_runs_for_user(db, user_id=u.id)
-            reset_progress(db, user_id=u.id, next_send_at=now)
-    finally:
-        db.close()
-    await call.answer("Сброшено для всех ✅", show_alert=True)
+    await run_db(session_factory, reset_all_progress, next_send_at=now)
     text = await _render_admin_menu_text(telegram_id=call.from_user.id, session_factory=session_factory)
-    await _smart_edit(call, text, reply_markup=admins_menu_kb())
+    await asyncio.gather(
+        _awaited(call.answer("Сброшено для всех ✅", show_alert=True)),
+        _smart_edit(call, text, reply_markup=admins_menu_kb()),
+    )
 
 
 
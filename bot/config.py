@@ -1,36 +1,43 @@
 import os
 from dataclasses import dataclass
+from functools import cache
+from zoneinfo import ZoneInfo
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
-def _parse_admin_ids(raw: str) -> set[int]:
+def _parse_admin_ids(raw: str) -> frozenset[int]:
     if not raw:
-        return set()
+        return frozenset()
     out: set[int] = set()
     for part in raw.split(","):
         part = part.strip()
         if not part:
             continue
         out.add(int(part))
-    return out
+    return frozenset(out)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Settings:
     bot_token: str
-    admin_ids: set[int]
+    admin_ids: frozenset[int]
     tz: str
+    tzinfo: ZoneInfo  # resolved once from `tz`
     database_url: str
     seed_json_path: str
     seed_on_start: bool
     seed_wipe_on_start: bool
     max_responses_per_task: int
+    db_pool_size: int  # PostgreSQL only
+    db_max_overflow: int
 
 
+@cache
 def load_settings() -> Settings:
+    # Env is read once per process; later calls return the same frozen Settings.
     bot_token = os.getenv("BOT_TOKEN", "").strip()
     if not bot_token:
         raise RuntimeError("BOT_TOKEN is not set")
@@ -43,16 +50,21 @@ def load_settings() -> Settings:
     seed_on_start = os.getenv("SEED_ON_START", "0").strip().lower() not in ("0", "false", "no")
     seed_wipe_on_start = os.getenv("SEED_WIPE_ON_START", "0").strip().lower() in ("1", "true", "yes")
     max_responses_per_task = int(os.getenv("MAX_RESPONSES_PER_TASK", "3").strip() or "3")
+    db_pool_size = int(os.getenv("DB_POOL_SIZE", "10").strip() or "10")
+    db_max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "20").strip() or "20")
 
     return Settings(
         bot_token=bot_token,
         admin_ids=admin_ids,
         tz=tz,
+        tzinfo=ZoneInfo(tz),
         database_url=database_url,
         seed_json_path=seed_json_path,
         seed_on_start=seed_on_start,
         seed_wipe_on_start=seed_wipe_on_start,
         max_responses_per_task=max_responses_per_task,
+        db_pool_size=db_pool_size,
+        db_max_overflow=db_max_overflow,
     )
 
 
@@ -1,22 +1,38 @@
+import asyncio
 import datetime as dt
+import hashlib
 import os
-from typing import Optional
+import time
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, NamedTuple, Optional
 
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
     UniqueConstraint,
+    bindparam,
+    case,
     create_engine,
     delete,
+    event,
+    exists,
     func,
+    insert,
+    literal,
     select,
     update,
 )
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column, sessionmaker
+from sqlalchemy.schema import CreateIndex, CreateTable
 
 
 DEFAULT_GREETING_TEXT = (
@@ -54,7 +70,7 @@ class User(Base):
     __tablename__ = "users"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    telegram_id: Mapped[int] = mapped_column(Integer, unique=True, index=True, nullable=False)
+    telegram_id: Mapped[int] = mapped_column(BigInteger, unique=True, index=True, nullable=False)  # ids exceed 2**31
     is_admin: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False, index=True)
     full_name: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     region: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
@@ -111,9 +127,13 @@ class Progress(Base):
 
 class Response(Base):
     __tablename__ = "responses"
+    __table_args__ = (
+        # Responses of a run in seq order, and MAX(seq) in add_response.
+        Index("ix_responses_run_seq", "run_id", "seq"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    run_id: Mapped[int] = mapped_column(Integer, ForeignKey("task_runs.id", ondelete="CASCADE"), index=True, nullable=False)
+    run_id: Mapped[int] = mapped_column(Integer, ForeignKey("task_runs.id", ondelete="CASCADE"), nullable=False)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
     post_id: Mapped[int] = mapped_column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), index=True, nullable=False)
     seq: Mapped[int] = mapped_column(Integer, default=1, nullable=False)
@@ -128,9 +148,15 @@ class TaskRun(Base):
     """
 
     __tablename__ = "task_runs"
+    __table_args__ = (
+        # "Latest run per (user, post)" lookups: export window, summaries.
+        Index("ix_task_runs_user_post_started", "user_id", "post_id", "started_at", "id"),
+        # Open runs of a user (get_latest_open_run).
+        Index("ix_task_runs_user_until", "user_id", "until"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     post_id: Mapped[int] = mapped_column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), index=True, nullable=False)
     started_at: Mapped[dt.datetime] = mapped_column(DateTime(), nullable=False, index=True)
     until: Mapped[dt.datetime] = mapped_column(DateTime(), nullable=False, index=True)
@@ -162,32 +188,113 @@ class AppSettings(Base):
     updated_at: Mapped[dt.datetime] = mapped_column(DateTime(), default=lambda: dt.datetime.now(), nullable=False)
 
 
-def make_engine(database_url: str):
+class SchemaMeta(Base):
+    """
+    Single row: fingerprint of the DDL `init_db` last brought the database up to.
+    """
+
+    __tablename__ = "schema_meta"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+
+
+# Hot per-update lookups, built once; parameters are bound per call.
+_USER_BY_TG = select(User).where(User.telegram_id == bindparam("tg"))
+_USER_ID_BY_TG = select(User.id).where(User.telegram_id == bindparam("tg"))
+_POST_BY_POSITION = select(Post).where(Post.position == bindparam("position"))
+_LATEST_OPEN_RUN = (
+    select(TaskRun)
+    .where(TaskRun.user_id == bindparam("user_id"), TaskRun.until >= bindparam("now"))
+    .order_by(TaskRun.started_at.desc(), TaskRun.id.desc())
+)
+_LATEST_OPEN_RUN_FOR_POST = _LATEST_OPEN_RUN.where(TaskRun.post_id == bindparam("post_id"))
+_COUNT_RESPONSES_FOR_RUN = select(func.count()).select_from(Response).where(Response.run_id == bindparam("run_id"))
+
+
+def make_engine(database_url: str, *, pool_size: int = 10, max_overflow: int = 20):
     # Ensure local folder exists for sqlite relative path
     if database_url.startswith("sqlite:///./"):
         os.makedirs("bot_data", exist_ok=True)
     
     # Настройки пула соединений для PostgreSQL
+    # (SQLite keeps SQLAlchemy's default QueuePool: one connection per run_db worker thread;
+    # a single shared StaticPool connection would interleave their transactions).
     pool_kwargs = {}
     if database_url.startswith("postgres"):
         pool_kwargs = {
-            "pool_size": 10,  # Размер пула соединений
-            "max_overflow": 20,  # Максимальное количество дополнительных соединений
+            "pool_size": pool_size,  # Размер пула соединений (DB_POOL_SIZE)
+            "max_overflow": max_overflow,  # Максимальное количество дополнительных соединений (DB_MAX_OVERFLOW)
             "pool_timeout": 30,  # Таймаут ожидания соединения
             "pool_recycle": 3600,  # Переиспользование соединений через час
             "pool_pre_ping": True,  # Проверка соединений перед использованием
         }
     
-    return create_engine(database_url, future=True, **pool_kwargs)
+    engine = create_engine(database_url, future=True, **pool_kwargs)
+    if database_url.startswith("sqlite"):
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+
+# WAL lets the scheduler read while handlers write; NORMAL syncs on checkpoint, not every commit.
+# foreign_keys stays off: turning it on would start cascading deletes that SQLite installs never ran.
+_SQLITE_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "cache_size=-65536",
+    "mmap_size=268435456",
+    "busy_timeout=5000",
+)
+
+
+def _set_sqlite_pragmas(dbapi_conn, _record) -> None:
+    cur = dbapi_conn.cursor()
+    try:
+        for pragma in _SQLITE_PRAGMAS:
+            cur.execute(f"PRAGMA {pragma}")
+    finally:
+        cur.close()
 
 
 def make_session_factory(engine):
     return sessionmaker(bind=engine, expire_on_commit=False, class_=Session, future=True)
 
 
+async def run_db(session_factory, fn, /, *args, **kwargs):
+    """
+    Run `fn(db, *args, **kwargs)` with a fresh session in a worker thread,
+    so blocking driver I/O doesn't stall the event loop for other updates.
+    Sessions use expire_on_commit=False, so returned ORM objects stay readable.
+    """
+
+    def _call():
+        with session_factory() as db:
+            return fn(db, *args, **kwargs)
+
+    return await asyncio.to_thread(_call)
+
+
+def _schema_fingerprint(engine) -> str:
+    tables = Base.metadata.sorted_tables
+    ddl = [str(CreateTable(t).compile(bind=engine)) for t in tables]
+    ddl += [str(CreateIndex(i).compile(bind=engine)) for t in tables for i in sorted(t.indexes, key=lambda i: i.name)]
+    return hashlib.sha256("\n".join(ddl).encode()).hexdigest()
+
+
 def init_db(engine) -> None:
     os.makedirs("bot_data", exist_ok=True)
 
+    # Unchanged models since the last successful init_db: skip the schema checks entirely.
+    fingerprint = _schema_fingerprint(engine)
+    try:
+        with engine.connect() as conn:
+            if conn.scalar(select(SchemaMeta.fingerprint).where(SchemaMeta.id == 1)) == fingerprint:
+                return
+    except Exception:
+        # No schema_meta table yet (fresh DB or pre-fingerprint install).
+        pass
+
     # SQLite: best-effort schema compatibility for rapid iteration.
     # If the existing DB has an old schema (missing columns), drop and recreate our tables.
     try:
@@ -303,7 +410,23 @@ def init_db(engine) -> None:
         # Don't block startup on schema checks (e.g. non-sqlite, permission issues).
         pass
 
+    # PostgreSQL installs created before telegram_id became BIGINT (SQLite INTEGER is already 64-bit).
+    if engine.dialect.name == "postgresql":
+        try:
+            with engine.begin() as conn:
+                conn.exec_driver_sql("ALTER TABLE IF EXISTS users ALTER COLUMN telegram_id TYPE BIGINT")
+        except Exception:
+            pass
+
     Base.metadata.create_all(bind=engine)
+    # create_all only indexes tables it creates; add indexes introduced later to existing DBs.
+    for table in (TaskRun.__table__, Response.__table__):
+        for idx in table.indexes:
+            idx.create(bind=engine, checkfirst=True)
+
+    with engine.begin() as conn:
+        conn.execute(delete(SchemaMeta))
+        conn.execute(insert(SchemaMeta).values(id=1, fingerprint=fingerprint))
 
 
 def get_app_settings(db: Session) -> AppSettings:
@@ -327,11 +450,91 @@ def get_app_settings(db: Session) -> AppSettings:
     return s
 
 
+class AppSettingsSnapshot(NamedTuple):
+    """
+    Detached copy of the `app_settings` fields read by handlers (no session needed).
+    """
+
+    greeting_text: str
+    greeting_media_type: Optional[str]
+    greeting_file_id: Optional[str]
+    final_text: str
+    final_media_type: Optional[str]
+    final_file_id: Optional[str]
+    response_window_minutes: int
+    send_interval_minutes: int
+
+
+# Singleton settings row changes only via admin setters below, which invalidate the cache.
+APP_SETTINGS_CACHE_TTL_SECONDS = 30.0
+_app_settings_cache: dict[str, Any] = {"v": None, "exp": 0.0, "gen": 0}
+
+
+def invalidate_app_settings_cache() -> None:
+    _app_settings_cache["exp"] = 0.0
+    _app_settings_cache["gen"] += 1
+
+
+def _load_app_settings_snapshot(db: Session) -> AppSettingsSnapshot:
+    s = get_app_settings(db)
+    return AppSettingsSnapshot(
+        greeting_text=s.greeting_text,
+        greeting_media_type=s.greeting_media_type,
+        greeting_file_id=s.greeting_file_id,
+        final_text=s.final_text,
+        final_media_type=s.final_media_type,
+        final_file_id=s.final_file_id,
+        response_window_minutes=int(s.response_window_minutes),
+        send_interval_minutes=int(s.send_interval_minutes),
+    )
+
+
+def _cached_app_settings(now: float) -> Optional[AppSettingsSnapshot]:
+    snap = _app_settings_cache["v"]
+    if snap is not None and now < _app_settings_cache["exp"]:
+        return snap
+    return None
+
+
+def _store_app_settings(snap: AppSettingsSnapshot, *, gen: int, now: float) -> None:
+    # Don't cache a read that raced with a setter; the next call reloads.
+    if gen == _app_settings_cache["gen"]:
+        _app_settings_cache["v"] = snap
+        _app_settings_cache["exp"] = now + APP_SETTINGS_CACHE_TTL_SECONDS
+
+
+def get_app_settings_snapshot(db: Session) -> AppSettingsSnapshot:
+    """
+    TTL-cached `get_app_settings` for code that already holds a session (SELECT only on cache miss).
+    """
+    now = time.monotonic()
+    snap = _cached_app_settings(now)
+    if snap is None:
+        gen = _app_settings_cache["gen"]
+        snap = _load_app_settings_snapshot(db)
+        _store_app_settings(snap, gen=gen, now=now)
+    return snap
+
+
+async def get_app_settings_cached(session_factory) -> AppSettingsSnapshot:
+    """
+    TTL-cached `get_app_settings`: opens a session (in a worker thread) only on cache miss.
+    """
+    now = time.monotonic()
+    snap = _cached_app_settings(now)
+    if snap is None:
+        gen = _app_settings_cache["gen"]
+        snap = await run_db(session_factory, _load_app_settings_snapshot)
+        _store_app_settings(snap, gen=gen, now=now)
+    return snap
+
+
 def set_greeting_text(db: Session, *, text: str) -> AppSettings:
     s = get_app_settings(db)
     s.greeting_text = text
     s.updated_at = dt.datetime.now()
     db.commit()
+    invalidate_app_settings_cache()
     return s
 
 
@@ -341,6 +544,7 @@ def set_greeting_media(db: Session, *, media_type: Optional[str], file_id: Optio
     s.greeting_file_id = file_id
     s.updated_at = dt.datetime.now()
     db.commit()
+    invalidate_app_settings_cache()
     return s
 
 
@@ -349,6 +553,7 @@ def set_final_text(db: Session, *, text: str) -> AppSettings:
     s.final_text = text
     s.updated_at = dt.datetime.now()
     db.commit()
+    invalidate_app_settings_cache()
     return s
 
 
@@ -358,6 +563,7 @@ def set_final_media(db: Session, *, media_type: Optional[str], file_id: Optional
     s.final_file_id = file_id
     s.updated_at = dt.datetime.now()
     db.commit()
+    invalidate_app_settings_cache()
     return s
 
 
@@ -371,6 +577,7 @@ def set_response_window_minutes(db: Session, *, minutes: int) -> AppSettings:
     s.response_window_minutes = m
     s.updated_at = dt.datetime.now()
     db.commit()
+    invalidate_app_settings_cache()
     return s
 
 
@@ -384,15 +591,17 @@ def set_send_interval_minutes(db: Session, *, minutes: int) -> AppSettings:
     s.send_interval_minutes = m
     s.updated_at = dt.datetime.now()
     db.commit()
+    invalidate_app_settings_cache()
     return s
 
 
 def delete_user_by_telegram_id(db: Session, telegram_id: int) -> bool:
-    u = db.scalar(select(User).where(User.telegram_id == telegram_id))
+    u = db.scalar(_USER_BY_TG, {"tg": telegram_id})
     if not u:
         return False
     db.delete(u)
     db.commit()
+    _user_id_cache.pop(telegram_id, None)
     return True
 
 
@@ -411,13 +620,39 @@ def now_utc() -> dt.datetime:
     return dt.datetime.utcnow()
 
 
+def _insert_on_conflict(db: Session):
+    """
+    Dialect `insert()` with ON CONFLICT support (SQLite / PostgreSQL), or None for other backends.
+    """
+    name = db.get_bind().dialect.name
+    if name == "sqlite":
+        return sqlite_insert
+    if name == "postgresql":
+        return pg_insert
+    return None
+
+
 def upsert_user(db: Session, telegram_id: int) -> User:
-    user = db.scalar(select(User).where(User.telegram_id == telegram_id))
+    user = get_user_by_telegram_id(db, telegram_id)
     if user:
         return user
-    user = User(telegram_id=telegram_id, is_admin=False)
-    db.add(user)
+    ins = _insert_on_conflict(db)
+    if ins is None:
+        user = User(telegram_id=telegram_id, is_admin=False)
+        db.add(user)
+        db.commit()
+        return user
+    # A concurrent /start may have inserted the row since the SELECT: DO NOTHING instead of
+    # an IntegrityError, then read the winner's row.
+    user = db.scalar(
+        ins(User)
+        .values(telegram_id=telegram_id, is_admin=False)
+        .on_conflict_do_nothing(index_elements=[User.telegram_id])
+        .returning(User)
+    )
     db.commit()
+    if user is None:
+        user = db.scalar(_USER_BY_TG, {"tg": telegram_id})
     return user
 
 
@@ -426,14 +661,43 @@ def set_user_admin_flag(db: Session, telegram_id: int, is_admin: bool) -> None:
     db.commit()
 
 
+# telegram_id -> users.id. A row's id never changes; delete_user_by_telegram_id drops the entry.
+_user_id_cache: dict[int, int] = {}
+
+
 def get_user_by_telegram_id(db: Session, telegram_id: int) -> Optional[User]:
     """
     Получить пользователя по telegram_id.
     """
-    return db.scalar(select(User).where(User.telegram_id == telegram_id))
+    uid = _user_id_cache.get(telegram_id)
+    if uid is not None:
+        # Primary-key get: served from the session's identity map when already loaded.
+        user = db.get(User, uid)
+        if user is not None and user.telegram_id == telegram_id:
+            return user
+        _user_id_cache.pop(telegram_id, None)
+    user = db.scalar(_USER_BY_TG, {"tg": telegram_id})
+    if user is not None:
+        _user_id_cache[telegram_id] = user.id
+    return user
+
+
+def get_user_id_by_telegram_id(db: Session, telegram_id: int) -> Optional[int]:
+    """
+    Like `get_user_by_telegram_id`, but only the id, and memoized per process.
+    """
+    uid = _user_id_cache.get(telegram_id)
+    if uid is None:
+        uid = db.scalar(_USER_ID_BY_TG, {"tg": telegram_id})
+        if uid is not None:
+            _user_id_cache[telegram_id] = uid
+    return uid
 
 
-def get_or_create_progress(db: Session, *, user_id: int, next_send_at: dt.datetime) -> Progress:
+def get_or_create_progress(db: Session, *, user_id: int, next_send_at: dt.datetime, commit: bool = True) -> Progress:
+    """
+    With commit=False the caller commits; a new row is already inserted (it has an id).
+    """
     p = db.scalar(select(Progress).where(Progress.user_id == user_id))
     if p:
         # Keep minute precision for scheduling
@@ -442,15 +706,44 @@ def get_or_create_progress(db: Session, *, user_id: int, next_send_at: dt.dateti
             if floored != p.next_send_at:
                 p.next_send_at = floored
                 p.updated_at = dt.datetime.now()
-                db.commit()
+                if commit:
+                    db.commit()
         return p
     next_send_at = next_send_at.replace(second=0, microsecond=0)
-    p = Progress(user_id=user_id, next_position=1, next_send_at=next_send_at)
-    db.add(p)
-    db.commit()
+    ins = _insert_on_conflict(db)
+    if ins is None:
+        p = Progress(user_id=user_id, next_position=1, next_send_at=next_send_at)
+        db.add(p)
+        db.flush()
+    else:
+        # Same race handling as upsert_user: a concurrent update may have created the row.
+        p = db.scalar(
+            ins(Progress)
+            .values(user_id=user_id, next_position=1, next_send_at=next_send_at)
+            .on_conflict_do_nothing(index_elements=[Progress.user_id])
+            .returning(Progress)
+        )
+        if p is None:
+            p = db.scalar(select(Progress).where(Progress.user_id == user_id))
+    if commit:
+        db.commit()
     return p
 
 
+# Bumped after writes that change what admin screens show (posts, progress resets),
+# so in-process caches can tell "nothing written since" without a query.
+_data_version = 0
+
+
+def data_version() -> int:
+    return _data_version
+
+
+def bump_data_version() -> None:
+    global _data_version
+    _data_version += 1
+
+
 def reset_progress(db: Session, *, user_id: int, next_send_at: dt.datetime) -> None:
     p = db.scalar(select(Progress).where(Progress.user_id == user_id))
     if not p:
@@ -467,10 +760,55 @@ def reset_progress(db: Session, *, user_id: int, next_send_at: dt.datetime) -> N
         p.summary_prompt_sent = False
         p.updated_at = dt.datetime.now()
     db.commit()
+    bump_data_version()
+
+
+def reset_all_progress(db: Session, *, next_send_at: dt.datetime) -> None:
+    """
+    Set-based `delete_task_runs_for_user` + `reset_progress` for every user, in one transaction.
+    """
+    next_send_at = next_send_at.replace(second=0, microsecond=0)
+    now = dt.datetime.now()
+    db.execute(delete(Response))
+    db.execute(delete(TaskRun))
+    db.execute(
+        update(Progress).values(
+            next_position=1,
+            next_send_at=next_send_at,
+            pending_post_id=None,
+            active_post_id=None,
+            active_started_at=None,
+            active_until=None,
+            summary_prompt_sent=False,
+            updated_at=now,
+        )
+    )
+    # Users without a progress row get a fresh one (same as reset_progress).
+    db.execute(
+        insert(Progress).from_select(
+            ["user_id", "next_position", "next_send_at", "summary_prompt_sent", "updated_at"],
+            select(
+                User.id,
+                literal(1),
+                literal(next_send_at, DateTime()),
+                literal(False),
+                literal(now, DateTime()),
+            ).where(~exists().where(Progress.user_id == User.id)),
+        )
+    )
+    db.commit()
+    bump_data_version()
+
 
+def get_telegram_ids_page(db: Session, *, after_user_id: int, limit: int) -> list[tuple[int, int]]:
+    """
+    Keyset page of (user id, telegram_id) with user id > `after_user_id`, ordered by user id.
+    """
+    rows = db.execute(
+        select(User.id, User.telegram_id).where(User.id > after_user_id).order_by(User.id.asc()).limit(limit)
+    ).all()
+    return [tuple(r) for r in rows]
 
-def get_all_users(db: Session) -> list[User]:
-    return list(db.scalars(select(User)))
 
 def count_users(db: Session) -> int:
     return int(db.scalar(select(func.count()).select_from(User)) or 0)
@@ -481,36 +819,51 @@ def count_posts(db: Session) -> int:
     return int(db.scalar(stmt) or 0)
 
 
-def list_posts(db: Session, *, limit: int, offset: int) -> list[Post]:
+def list_posts_page(db: Session, *, limit: int, offset: int) -> tuple[int, list[tuple[int, int, str]]]:
+    """
+    One page of (id, position, title) plus the total posts count.
+    COUNT(*) OVER () carries the total on every row, so this is one round-trip.
+    """
     stmt = (
-        select(Post)
+        select(Post.id, Post.position, Post.title, func.count().over())
         .order_by(Post.position.asc(), Post.id.asc())
         .limit(limit)
         .offset(offset)
     )
-    return list(db.scalars(stmt))
+    rows = db.execute(stmt).all()
+    if not rows:
+        # Offset past the end (e.g. after a delete): no row carries the total.
+        return (count_posts(db) if offset else 0), []
+    return rows[0][3], [(pid, pos, title) for pid, pos, title, _ in rows]
 
 
 def get_post_by_position(db: Session, *, position: int) -> Optional[Post]:
-    return db.scalar(select(Post).where(Post.position == position))
+    return db.scalar(_POST_BY_POSITION, {"position": position})
 
 
 def get_post(db: Session, post_id: int) -> Optional[Post]:
-    return db.scalar(select(Post).where(Post.id == post_id))
+    return db.get(Post, post_id)
 
 
 def create_post(db: Session, *, title: str, text_html: str, media_type: Optional[str], file_id: Optional[str]) -> Post:
-    max_pos = int(db.scalar(select(func.max(Post.position))) or 0)
-    post = Post(
-        position=max_pos + 1,
-        title=title.strip(),
-        text_html=text_html,
-        media_type=media_type,
-        file_id=file_id,
-        updated_at=dt.datetime.now(),
+    # Next position computed inside the INSERT: one round-trip, no gap between read and write.
+    post = db.scalar(
+        insert(Post)
+        .from_select(
+            ["position", "title", "text_html", "media_type", "file_id", "updated_at"],
+            select(
+                func.coalesce(func.max(Post.position), 0) + 1,
+                literal(title.strip(), String()),
+                literal(text_html, Text()),
+                literal(media_type, String()),
+                literal(file_id, Text()),
+                literal(dt.datetime.now(), DateTime()),
+            ),
+        )
+        .returning(Post)
     )
-    db.add(post)
     db.commit()
+    bump_data_version()
     return post
 
 
@@ -531,150 +884,128 @@ def update_post(db: Session, post_id: int, *, title: Optional[str] = None, text_
 
 
 def delete_post(db: Session, post_id: int) -> bool:
-    post = get_post(db, post_id)
-    if not post:
+    pos = db.scalar(delete(Post).where(Post.id == post_id).returning(Post.position))
+    if pos is None:
+        db.rollback()
         return False
-    pos = post.position
-    db.delete(post)
-    db.commit()
-    # shift down
-    db.execute(
-        update(Post)
-        .where(Post.position > pos)
-        .values(position=Post.position - 1, updated_at=dt.datetime.now())
-    )
+    # shift down in the same transaction; like move_post, go through negative positions
+    # so the per-row UNIQUE(position) check never sees two rows on one slot.
+    now = dt.datetime.now()
+    db.execute(update(Post).where(Post.position > pos).values(position=1 - Post.position, updated_at=now))
+    db.execute(update(Post).where(Post.position < 0).values(position=-Post.position))
     db.commit()
+    bump_data_version()
     return True
 
 
 def move_post(db: Session, *, post_id: int, direction: str) -> bool:
-    post = get_post(db, post_id)
-    if not post:
-        return False
     if direction not in ("up", "down"):
         return False
     delta = -1 if direction == "up" else 1
-    target_pos = post.position + delta
-    if target_pos < 1:
-        return False
-    other = db.scalar(select(Post).where(Post.position == target_pos))
-    if not other:
+    # The post and its neighbour in one SELECT.
+    src_pos = select(Post.position).where(Post.id == post_id).scalar_subquery()
+    rows = db.execute(
+        select(Post.id, Post.position).where((Post.id == post_id) | (Post.position == src_pos + delta))
+    ).all()
+    if len(rows) != 2:
         return False
-    # swap positions safely under UNIQUE(level, position) (SQLite checks immediately)
-    now = dt.datetime.now()
-    src_pos = post.position
-    dst_pos = other.position
-
-    # Use a temporary position that can't collide (0 is outside 1..N).
-    post.position = 0
-    post.updated_at = now
-    db.flush()
-
-    other.position = src_pos
-    other.updated_at = now
-    db.flush()
-
-    post.position = dst_pos
-    post.updated_at = now
-    db.flush()
+    pos = {row.id: row.position for row in rows}
+    other_id = next(i for i in pos if i != post_id)
 
+    # swap positions safely under UNIQUE(position): SQLite and Postgres check it per row,
+    # so park both rows on (distinct) negative positions first, then set the final ones.
+    now = dt.datetime.now()
+    ids = (post_id, other_id)
+    db.execute(update(Post).where(Post.id.in_(ids)).values(position=-Post.position))
+    db.execute(
+        update(Post)
+        .where(Post.id.in_(ids))
+        .values(
+            position=case((Post.id == post_id, pos[other_id]), else_=pos[post_id]),
+            updated_at=now,
+        )
+    )
     db.commit()
     return True
 
 
-def create_task_run(db: Session, *, user_id: int, post_id: int, started_at: dt.datetime, until: dt.datetime) -> TaskRun:
+def create_task_run(
+    db: Session, *, user_id: int, post_id: int, started_at: dt.datetime, until: dt.datetime, commit: bool = True
+) -> TaskRun:
     run = TaskRun(user_id=user_id, post_id=post_id, started_at=started_at, until=until, updated_at=dt.datetime.now())
     db.add(run)
-    db.commit()
+    if commit:
+        db.commit()
     return run
 
 
 def get_latest_open_run(db: Session, *, user_id: int, now: dt.datetime) -> Optional[TaskRun]:
-    return db.scalar(
-        select(TaskRun)
-        .where(TaskRun.user_id == user_id, TaskRun.until >= now)
-        .order_by(TaskRun.started_at.desc(), TaskRun.id.desc())
-    )
+    return db.scalar(_LATEST_OPEN_RUN, {"user_id": user_id, "now": now})
 
 
 def get_latest_open_run_for_post(db: Session, *, user_id: int, post_id: int, now: dt.datetime) -> Optional[TaskRun]:
-    return db.scalar(
-        select(TaskRun)
-        .where(TaskRun.user_id == user_id, TaskRun.post_id == post_id, TaskRun.until >= now)
-        .order_by(TaskRun.started_at.desc(), TaskRun.id.desc())
-    )
+    return db.scalar(_LATEST_OPEN_RUN_FOR_POST, {"user_id": user_id, "post_id": post_id, "now": now})
 
 
-def add_response(db: Session, *, run_id: int, user_id: int, post_id: int, text: str) -> Response:
-    seq = int(db.scalar(select(func.max(Response.seq)).where(Response.run_id == run_id)) or 0) + 1
-    r = Response(run_id=run_id, user_id=user_id, post_id=post_id, seq=seq, text=text)
-    db.add(r)
-    db.commit()
+def add_response(db: Session, *, run_id: int, user_id: int, post_id: int, text: str, commit: bool = True) -> Response:
+    # Next seq within the run computed inside the INSERT (same pattern as create_post).
+    r = db.scalar(
+        insert(Response)
+        .from_select(
+            ["run_id", "user_id", "post_id", "seq", "text", "created_at"],
+            select(
+                literal(run_id, Integer()),
+                literal(user_id, Integer()),
+                literal(post_id, Integer()),
+                func.coalesce(func.max(Response.seq), 0) + 1,
+                literal(text, Text()),
+                literal(dt.datetime.now(), DateTime()),
+            ).where(Response.run_id == run_id),
+        )
+        .returning(Response)
+    )
+    if commit:
+        db.commit()
     return r
 
 
 def count_responses_for_run(db: Session, *, run_id: int) -> int:
-    return int(db.scalar(select(func.count()).select_from(Response).where(Response.run_id == run_id)) or 0)
+    return int(db.scalar(_COUNT_RESPONSES_FOR_RUN, {"run_id": run_id}) or 0)
 
 
-def close_run_now(db: Session, *, run_id: int, now: dt.datetime) -> None:
+def close_run_now(db: Session, *, run_id: int, now: dt.datetime, commit: bool = True) -> None:
     # Ensure it is considered closed for any subsequent "now" comparisons.
     closed_until = now - dt.timedelta(microseconds=1)
     db.execute(update(TaskRun).where(TaskRun.id == run_id).values(until=closed_until, updated_at=dt.datetime.now()))
-    db.commit()
+    if commit:
+        db.commit()
 
 
 def get_responses_for_user(db: Session, *, user_id: int) -> list[tuple[Post, list[Response]]]:
     """
     Returns summary items per post. If a post has multiple TaskRuns for the user,
-    we include responses only from the latest run (by started_at).
+    we include responses only from the latest run (by started_at, then id).
     """
-    posts = list(db.scalars(select(Post).order_by(Post.position.asc(), Post.id.asc())))
-    if not posts:
-        return []
-
-    post_ids = [p.id for p in posts]
-
-    # latest run per post for this user
-    latest_runs = list(
-        db.execute(
-            select(
-                TaskRun.post_id,
-                func.max(TaskRun.started_at).label("max_started_at"),
-            )
-            .where(TaskRun.user_id == user_id, TaskRun.post_id.in_(post_ids))
-            .group_by(TaskRun.post_id)
-        ).all()
-    )
-    if not latest_runs:
-        return [(p, []) for p in posts]
-
-    # Map post_id -> latest started_at
-    latest_started_at: dict[int, dt.datetime] = {int(pid): msa for (pid, msa) in latest_runs if msa is not None}
-
-    # Fetch run ids that match (post_id, started_at)
-    run_rows = list(
-        db.execute(
-            select(TaskRun.id, TaskRun.post_id)
-            .where(
-                TaskRun.user_id == user_id,
-                TaskRun.post_id.in_(list(latest_started_at.keys())),
-                TaskRun.started_at.in_(list(latest_started_at.values())),
-            )
-        ).all()
-    )
-    run_by_post: dict[int, int] = {int(post_id): int(run_id) for (run_id, post_id) in run_rows}
-
-    run_ids = list(run_by_post.values())
-    rs = list(
-        db.scalars(
-            select(Response)
-            .where(Response.user_id == user_id, Response.run_id.in_(run_ids))
-            .order_by(Response.post_id.asc(), Response.seq.asc(), Response.id.asc())
+    # Latest run per post (by started_at, ties -> higher id), joined to posts and responses in one query.
+    latest = (
+        select(
+            TaskRun.id.label("run_id"),
+            TaskRun.post_id.label("post_id"),
+            func.row_number()
+            .over(partition_by=TaskRun.post_id, order_by=(TaskRun.started_at.desc(), TaskRun.id.desc()))
+            .label("rn"),
         )
+        .where(TaskRun.user_id == user_id)
+        .subquery()
     )
-    by_post: dict[int, list[Response]] = {}
-    for r in rs:
-        by_post.setdefault(r.post_id, []).append(r)
-
-    return [(p, by_post.get(p.id, [])) for p in posts]
+    rows = db.execute(
+        select(Post, Response)
+        .outerjoin(latest, (latest.c.post_id == Post.id) & (latest.c.rn == 1))
+        .outerjoin(Response, Response.run_id == latest.c.run_id)
+        .order_by(Post.position.asc(), Post.id.asc(), Response.seq.asc(), Response.id.asc())
+    ).all()
+
+    return [
+        (post, [r for _, r in group if r is not None])
+        for post, group in groupby(rows, key=itemgetter(0))
+    ]
@@ -1,9 +1,5 @@
 import datetime as dt
-from zoneinfo import ZoneInfo
 
-import asyncio
-from html import escape as _h
-import os
 from aiogram import F, Router
 from aiogram.filters import BaseFilter, Command, StateFilter
 from aiogram.fsm.context import FSMContext
@@ -12,7 +8,7 @@ from aiogram.types import CallbackQuery, Message, FSInputFile
 from aiogram.types import BufferedInputFile
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.enums import ParseMode
-from sqlalchemy import select
+from sqlalchemy import select, update
 
 from bot.config import Settings
 from bot.db import (
@@ -25,8 +21,11 @@ from bot.db import (
     get_post_by_position,
     get_responses_for_user,
     get_user_by_telegram_id,
-    get_app_settings,
+    get_app_settings_cached,
+    get_app_settings_snapshot,
     count_responses_for_run,
+    run_db,
+    update_post,
     close_run_now,
     create_task_run,
     get_latest_open_run,
@@ -34,7 +33,16 @@ from bot.db import (
     set_user_admin_flag,
     upsert_user,
 )
-from bot.keyboards import onboarding_go_kb, start_task_kb, summary_full_kb, task_done_kb
+from bot.keyboards import (
+    SummaryFullCB,
+    TaskCB,
+    onboarding_go_kb,
+    start_task_kb,
+    summary_full_kb,
+    task_done_kb,
+)
+from bot.images import default_image_path
+from bot.text_utils import escape_html as _h
 
 router = Router()
 
@@ -61,7 +69,7 @@ class NotCommand(BaseFilter):
 
 def _tznow(settings: Settings) -> dt.datetime:
     # Store/compare all timestamps as tz-naive "local time" in settings.tz
-    return dt.datetime.now(ZoneInfo(settings.tz)).replace(tzinfo=None)
+    return dt.datetime.now(settings.tzinfo).replace(tzinfo=None)
 
 
 def _floor_to_minute(t: dt.datetime) -> dt.datetime:
@@ -112,33 +120,45 @@ def _summary_text_for_post(*, post, responses) -> str:
     Plain-text summary (no HTML) to avoid parse errors on arbitrary user content
     and to keep truncation safe.
     """
-    title = (post.title or "").strip()
-    body = f"День {post.position}. {title}\n\n"
-    body += "Ответ(ы):\n"
+    return "".join(_summary_parts(post=post, responses=responses))
+
+
+def _summary_parts(*, post, responses):
+    # Yielded lazily so _summary_item_payload can stop once it has enough text.
+    yield f"День {post.position}. {(post.title or '').strip()}\n\n"
+    yield "Ответ(ы):\n"
     if responses:
         for r in responses:
-            body += f"- {(r.text or '').strip()}\n"
+            yield f"- {(r.text or '').strip()}\n"
     else:
-        body += "- —\n"
-    return body
+        yield "- —\n"
 
 
-async def _send_summary_item(message_like, *, post, responses, truncate_to: int = 500) -> None:
+def _summary_item_payload(*, post, responses, truncate_to: int = 500):
     """
-    Sends one "question-answer" message per post.
+    One "question-answer" message per post: (text, reply_markup).
     If too long, truncates to `truncate_to` chars and adds a button to show full.
     """
-    full = _summary_text_for_post(post=post, responses=responses)
-    if len(full) <= truncate_to:
-        await message_like.answer(full, disable_web_page_preview=True, parse_mode=None)
-        return
-    short = full[: max(0, truncate_to - 1)].rstrip() + "…"
-    await message_like.answer(
-        short,
-        disable_web_page_preview=True,
-        reply_markup=summary_full_kb(post_id=post.id),
-        parse_mode=None,
-    )
+    parts: list[str] = []
+    n = 0
+    for piece in _summary_parts(post=post, responses=responses):
+        parts.append(piece)
+        n += len(piece)
+        if n > truncate_to:
+            break
+    else:
+        return "".join(parts), None
+    # Pieces past the one that crossed the limit are never formatted or joined.
+    short = "".join(parts)[: max(0, truncate_to - 1)].rstrip() + "…"
+    return short, summary_full_kb(post_id=post.id)
+
+
+async def _send_summary_items(message_like, items, *, truncate_to: int = 500) -> None:
+    # Build every payload up front so the loop below is network-only. Sends stay
+    # sequential: concurrent sendMessage calls to one chat may arrive out of day order.
+    payloads = [_summary_item_payload(post=p, responses=r, truncate_to=truncate_to) for p, r in items]
+    for text, kb in payloads:
+        await message_like.answer(text, disable_web_page_preview=True, reply_markup=kb, parse_mode=None)
 
 
 async def _safe_send_task_notification(bot, *, chat_id: int, post) -> None:
@@ -164,57 +184,98 @@ async def _safe_send_task_notification(bot, *, chat_id: int, post) -> None:
         raise
 
 
+def _load_due_task(db, *, telegram_id: int, now_min: dt.datetime):
+    """
+    Returns (status, post, progress_id); status "due" means `post` should be sent now.
+    """
+    user = get_user_by_telegram_id(db, telegram_id)
+    if not user:
+        return "no_user", None, None
+    if not getattr(user, "onboarded_at", None):
+        return "not_onboarded", None, None
+
+    prog = get_or_create_progress(db, user_id=user.id, next_send_at=now_min, commit=False)
+
+    # If we are at the very beginning, allow immediate first task after "ПОЕХАЛИ!"
+    if prog.next_position == 1 and prog.next_send_at and prog.next_send_at > now_min:
+        prog.next_send_at = now_min
+        prog.updated_at = dt.datetime.now()
+    db.commit()
+
+    if prog.pending_post_id:
+        return "already_pending", get_post(db, int(prog.pending_post_id)), prog.id
+    if prog.active_post_id:
+        return "already_active", None, prog.id
+
+    if prog.next_send_at and prog.next_send_at > now_min:
+        return "too_early", None, prog.id
+
+    max_posts = count_posts(db)
+    if prog.next_position > max_posts:
+        return "done", None, prog.id
+
+    post = get_post_by_position(db, position=int(prog.next_position))
+    if not post:
+        return "missing_post", None, prog.id
+    return "due", post, prog.id
+
+
+def _mark_task_pending(db, *, progress_id: int, post_id: int) -> None:
+    db.execute(
+        update(Progress)
+        .where(Progress.id == progress_id)
+        .values(pending_post_id=post_id, next_position=Progress.next_position + 1, updated_at=dt.datetime.now())
+    )
+    db.commit()
+
+
 async def _send_due_task_now(*, bot, session_factory, settings: Settings, telegram_id: int) -> str:
     """
     Send the next due task (same semantics as scheduler: one at a time, honor next_send_at).
     Returns a short status string for user feedback.
     """
-    now = _tznow(settings)
-    now_min = _floor_to_minute(now)
-
-    db = session_factory()
-    try:
-        user = get_user_by_telegram_id(db, telegram_id)
-        if not user:
-            return "no_user"
-        if not getattr(user, "onboarded_at", None):
-            return "not_onboarded"
+    now_min = _floor_to_minute(_tznow(settings))
+    status, post, progress_id = await run_db(session_factory, _load_due_task, telegram_id=telegram_id, now_min=now_min)
+    if status == "already_pending" and post:
+        await _safe_send_task_notification(bot, chat_id=telegram_id, post=post)
+    if status != "due":
+        return status
 
-        prog = get_or_create_progress(db, user_id=user.id, next_send_at=now_min)
+    await _safe_send_task_notification(bot, chat_id=telegram_id, post=post)
+    # Only advance progress once the notification actually went out.
+    await run_db(session_factory, _mark_task_pending, progress_id=progress_id, post_id=post.id)
+    return "sent"
 
-        # If we are at the very beginning, allow immediate first task after "ПОЕХАЛИ!"
-        if prog.next_position == 1 and prog.next_send_at and prog.next_send_at > now_min:
-            prog.next_send_at = now_min
-            prog.updated_at = dt.datetime.now()
-            db.commit()
 
-        if prog.pending_post_id:
-            post = get_post(db, int(prog.pending_post_id))
-            if post:
-                await _safe_send_task_notification(bot, chat_id=telegram_id, post=post)
-            return "already_pending"
-        if prog.active_post_id:
-            return "already_active"
+def _register_user(db, *, telegram_id: int, is_admin: bool) -> None:
+    upsert_user(db, telegram_id=telegram_id)
+    set_user_admin_flag(db, telegram_id=telegram_id, is_admin=is_admin)
 
-        if prog.next_send_at and prog.next_send_at > now_min:
-            return "too_early"
 
-        max_posts = count_posts(db)
-        if prog.next_position > max_posts:
-            return "done"
+def _save_profile_field(db, *, telegram_id: int, **fields) -> None:
+    user = get_user_by_telegram_id(db, telegram_id)
+    if not user:
+        user = upsert_user(db, telegram_id=telegram_id)
+    for name, value in fields.items():
+        setattr(user, name, value)
+    db.commit()
 
-        post = get_post_by_position(db, position=int(prog.next_position))
-        if not post:
-            return "missing_post"
 
-        await _safe_send_task_notification(bot, chat_id=telegram_id, post=post)
-        prog.pending_post_id = post.id
-        prog.next_position += 1
-        prog.updated_at = dt.datetime.now()
+def _mark_onboarded(db, *, telegram_id: int, now_min: dt.datetime) -> None:
+    user = get_user_by_telegram_id(db, telegram_id)
+    if not user:
+        user = upsert_user(db, telegram_id=telegram_id)
+    if not getattr(user, "onboarded_at", None):
+        user.onboarded_at = now_min
         db.commit()
-        return "sent"
-    finally:
-        db.close()
+
+
+def _load_user_summary(db, *, telegram_id: int):
+    # None when the user is unknown, otherwise get_responses_for_user() items.
+    user = get_user_by_telegram_id(db, telegram_id)
+    if not user:
+        return None
+    return get_responses_for_user(db, user_id=user.id)
 
 
 @router.message(Command("start"))
@@ -222,25 +283,17 @@ async def cmd_start(message: Message, settings: Settings, session_factory, state
     if not message.from_user:
         return
 
-    now = _tznow(settings)
-    now_min = _floor_to_minute(now)
-
-    db = session_factory()
-    try:
-        user = upsert_user(db, telegram_id=message.from_user.id)
-        set_user_admin_flag(db, telegram_id=user.telegram_id, is_admin=(user.telegram_id in settings.admin_ids))
+    telegram_id = message.from_user.id
+    await run_db(session_factory, _register_user, telegram_id=telegram_id, is_admin=(telegram_id in settings.admin_ids))
 
-        # /start always begins with onboarding сценарий
-        await state.clear()
-        await state.set_state(OnboardingFSM.fio)
-        await message.answer(
-            ONBOARDING_START_TEXT,
-            disable_web_page_preview=True,
-            parse_mode=None,
-        )
-        return
-    finally:
-        db.close()
+    # /start always begins with onboarding сценарий
+    await state.set_state(OnboardingFSM.fio)
+    await state.set_data({})
+    await message.answer(
+        ONBOARDING_START_TEXT,
+        disable_web_page_preview=True,
+        parse_mode=None,
+    )
 
 
 @router.message(Command("cancel"), StateFilter(OnboardingFSM))
@@ -257,15 +310,7 @@ async def onboarding_fio(message: Message, settings: Settings, session_factory,
     if len(fio) < 5:
         await message.answer("Пожалуйста, укажите полное Ф.И.О. (хотя бы 5 символов).")
         return
-    db = session_factory()
-    try:
-        user = get_user_by_telegram_id(db, message.from_user.id)
-        if not user:
-            user = upsert_user(db, telegram_id=message.from_user.id)
-        user.full_name = fio.strip()
-        db.commit()
-    finally:
-        db.close()
+    await run_db(session_factory, _save_profile_field, telegram_id=message.from_user.id, full_name=fio.strip())
     await state.set_state(OnboardingFSM.region)
     await message.answer("Укажите Ваш регион", parse_mode=None)
 
@@ -278,15 +323,7 @@ async def onboarding_region(message: Message, settings: Settings, session_factor
     if len(region) < 2:
         await message.answer("Пожалуйста, укажите регион (хотя бы 2 символа).")
         return
-    db = session_factory()
-    try:
-        user = get_user_by_telegram_id(db, message.from_user.id)
-        if not user:
-            user = upsert_user(db, telegram_id=message.from_user.id)
-        user.region = region.strip()
-        db.commit()
-    finally:
-        db.close()
+    await run_db(session_factory, _save_profile_field, telegram_id=message.from_user.id, region=region.strip())
     await state.set_state(OnboardingFSM.email)
     await message.answer("Укажите Вашу электронную почту", parse_mode=None)
 
@@ -312,33 +349,21 @@ async def onboarding_email(message: Message, settings: Settings, session_factory
         await message.answer("Пожалуйста, укажите корректный email (например: name@example.com).")
         return
 
-    db = session_factory()
-    try:
-        user = get_user_by_telegram_id(db, message.from_user.id)
-        if not user:
-            user = upsert_user(db, telegram_id=message.from_user.id)
-        user.email = email.strip()
-        db.commit()
-    finally:
-        db.close()
+    await run_db(session_factory, _save_profile_field, telegram_id=message.from_user.id, email=email.strip())
 
     # Send rules block (admin-editable greeting_text + optional image)
-    db = session_factory()
-    try:
-        app = get_app_settings(db)
-        rules_text = (app.greeting_text or "").strip() or DEFAULT_RULES_FALLBACK_TEXT
-        if getattr(app, "greeting_media_type", None) == "photo" and getattr(app, "greeting_file_id", None):
-            await _safe_send_photo_with_caption(
-                message,
-                file_id=str(app.greeting_file_id),
-                caption=rules_text,
-                disable_web_page_preview=True,
-                reply_markup=onboarding_go_kb(),
-            )
-        else:
-            await _safe_send_html(message, rules_text, disable_web_page_preview=True, reply_markup=onboarding_go_kb())
-    finally:
-        db.close()
+    app = await get_app_settings_cached(session_factory)
+    rules_text = (app.greeting_text or "").strip() or DEFAULT_RULES_FALLBACK_TEXT
+    if app.greeting_media_type == "photo" and app.greeting_file_id:
+        await _safe_send_photo_with_caption(
+            message,
+            file_id=str(app.greeting_file_id),
+            caption=rules_text,
+            disable_web_page_preview=True,
+            reply_markup=onboarding_go_kb(),
+        )
+    else:
+        await _safe_send_html(message, rules_text, disable_web_page_preview=True, reply_markup=onboarding_go_kb())
 
     await state.clear()
 
@@ -358,16 +383,7 @@ async def onboarding_go_callback(call: CallbackQuery, settings: Settings, sessio
     # Mark onboarding completed ONLY after "ПОЕХАЛИ!"
     now = _tznow(settings)
     now_min = _floor_to_minute(now)
-    db = session_factory()
-    try:
-        user = get_user_by_telegram_id(db, call.from_user.id)
-        if not user:
-            user = upsert_user(db, telegram_id=call.from_user.id)
-        if not getattr(user, "onboarded_at", None):
-            user.onboarded_at = now_min
-            db.commit()
-    finally:
-        db.close()
+    await run_db(session_factory, _mark_onboarded, telegram_id=call.from_user.id, now_min=now_min)
 
     status = await _send_due_task_now(
         bot=call.bot,
@@ -401,11 +417,7 @@ async def cmd_null(message: Message, settings: Settings, session_factory):
     """
     if not message.from_user:
         return
-    db = session_factory()
-    try:
-        ok = delete_user_by_telegram_id(db, message.from_user.id)
-    finally:
-        db.close()
+    ok = await run_db(session_factory, delete_user_by_telegram_id, message.from_user.id)
     await message.answer("✅ Сброшено." if ok else "Пользователь не найден.")
 
 
@@ -416,26 +428,56 @@ async def cmd_summary(message: Message, settings: Settings, session_factory):
     """
     if not message.from_user:
         return
-    db = session_factory()
-    try:
-        user = get_user_by_telegram_id(db, message.from_user.id)
-        if not user:
-            await message.answer("Пользователь не найден.")
-            return
-        items = get_responses_for_user(db, user_id=user.id)
-    finally:
-        db.close()
+    items = await run_db(session_factory, _load_user_summary, telegram_id=message.from_user.id)
+    if items is None:
+        await message.answer("Пользователь не найден.")
+        return
 
     if not items:
         await message.answer("Пока нет заданий или ответов.")
         return
     await message.answer("<b>Ваши ответы по дням</b>", disable_web_page_preview=True)
-    for post, responses in items:
-        await _send_summary_item(message, post=post, responses=responses, truncate_to=500)
+    await _send_summary_items(message, items, truncate_to=500)
 
 
-@router.callback_query(F.data.startswith("task:start:"))
-async def start_task_callback(call: CallbackQuery, settings: Settings, session_factory):
+def _open_task_run(db, *, telegram_id: int, post_id: int, now: dt.datetime):
+    """
+    Start (or keep) the answer window for `post_id`. Returns (post, response window
+    minutes), or (None, None) if the post is gone.
+    """
+    user = get_user_by_telegram_id(db, telegram_id)
+    if not user:
+        user = upsert_user(db, telegram_id=telegram_id)
+
+    post = get_post(db, post_id)
+    if not post:
+        return None, None
+
+    prog = get_or_create_progress(db, user_id=user.id, next_send_at=now, commit=False)
+
+    # If a run for this post is already open, do not "restart the timer".
+    existing_open = get_latest_open_run_for_post(db, user_id=user.id, post_id=post.id, now=now)
+
+    app = get_app_settings_snapshot(db)
+    if existing_open:
+        until = existing_open.until
+    else:
+        until = now + dt.timedelta(minutes=int(app.response_window_minutes))
+        create_task_run(db, user_id=user.id, post_id=post.id, started_at=now, until=until, commit=False)
+
+    # Keep Progress in sync (for status UI + "one active task" guard)
+    if prog.pending_post_id == post.id:
+        prog.pending_post_id = None
+    prog.active_post_id = post.id
+    prog.active_started_at = now
+    prog.active_until = until
+    prog.updated_at = dt.datetime.now()
+    db.commit()
+    return post, int(app.response_window_minutes)
+
+
+@router.callback_query(TaskCB.filter(F.action == "start"))
+async def start_task_callback(call: CallbackQuery, callback_data: TaskCB, settings: Settings, session_factory):
     if not call.from_user:
         return
     
@@ -445,85 +487,136 @@ async def start_task_callback(call: CallbackQuery, settings: Settings, session_f
     except Exception:
         pass
 
-    post_id = int(call.data.split(":", 2)[2])
+    post_id = callback_data.post_id
 
     now = _tznow(settings)
-    db = session_factory()
+    post, window_minutes = await run_db(
+        session_factory, _open_task_run, telegram_id=call.from_user.id, post_id=post_id, now=now
+    )
+    if not post:
+        await call.answer("Задание не найдено.", show_alert=True)
+        return
+    window_text = _fmt_wait_minutes(window_minutes)
+
+    # render day number procedurally (position)
+    text = (
+        f"<b>День {post.position}. {_h(post.title)}</b>\n\n"
+        f"{post.text_html}\n\n"
+        f"<b>Важно:</b> у вас есть <b>{window_text}</b> на выполнение задания с момента нажатия кнопки.\n"
+        f"Можно отправить до <b>{settings.max_responses_per_task}</b> сообщений."
+    )
+
+    # remove keyboard from previous message
     try:
-        user = get_user_by_telegram_id(db, call.from_user.id)
-        if not user:
-            user = upsert_user(db, telegram_id=call.from_user.id)
+        await call.message.edit_reply_markup(reply_markup=None)
+    except Exception:
+        pass
 
-        post = get_post(db, post_id)
-        if not post:
-            await call.answer("Задание не найдено.", show_alert=True)
-            return
+    # check for default image if no file_id is set
+    media = None
+    is_local_file = False
+    if post.media_type == "photo" and post.file_id:
+        media = post.file_id
+    else:
+        # try local file by day number
+        local_path = default_image_path(post.position)
+        if local_path:
+            media = FSInputFile(local_path)
+            is_local_file = True
+
+    # send media if found
+    if media:
+        try:
+            sent_msg = await call.message.answer_photo(photo=media, caption=text, request_timeout=120)
+            # If it was a local file and sent successfully, save the file_id to the DB for future use
+            if is_local_file and sent_msg.photo:
+                await run_db(session_factory, update_post, post.id, media_type="photo", file_id=sent_msg.photo[-1].file_id)
+        except Exception as e:
+            import logging
+            logging.getLogger(__name__).error("Failed to send photo for post %s: %s", post.id, e)
+            await call.message.answer(text, disable_web_page_preview=True)
+    else:
+        await call.message.answer(text, disable_web_page_preview=True)
+
+
+def _record_answer(
+    db,
+    *,
+    telegram_id: int,
+    position: int | None,
+    text: str,
+    now: dt.datetime,
+    max_responses: int,
+    fallback_to_latest: bool,
+):
+    """
+    Store one answer in the open run for day `position` (or, if allowed, the latest
+    open run). Returns (post_id, remaining, send_interval_minutes) or None if nothing
+    was recorded; the run is closed and the next send scheduled once the limit is hit.
+    """
+    user = get_user_by_telegram_id(db, telegram_id)
+    if not user:
+        return None
+
+    run = None
+    if position is not None:
+        post = get_post_by_position(db, position=position)
+        if post:
+            run = get_latest_open_run_for_post(db, user_id=user.id, post_id=post.id, now=now)
+    if not run and fallback_to_latest:
+        run = get_latest_open_run(db, user_id=user.id, now=now)
+    if not run:
+        return None
+
+    # limit to max_responses messages per task run
+    current_cnt = count_responses_for_run(db, run_id=run.id)
+    if current_cnt >= max_responses:
+        # silently close when limit reached
+        close_run_now(db, run_id=run.id, now=now)
+        return None
 
-        prog = get_or_create_progress(db, user_id=user.id, next_send_at=now)
+    post = get_post(db, run.post_id)
+    if not post:
+        return None
 
-        # If a run for this post is already open, do not "restart the timer".
-        existing_open = get_latest_open_run_for_post(db, user_id=user.id, post_id=post.id, now=now)
+    add_response(db, run_id=run.id, user_id=user.id, post_id=post.id, text=text, commit=False)
 
-        app = get_app_settings(db)
-        if existing_open:
-            until = existing_open.until
-        else:
-            until = now + dt.timedelta(minutes=int(app.response_window_minutes))
-            create_task_run(db, user_id=user.id, post_id=post.id, started_at=now, until=until)
+    interval = get_app_settings_snapshot(db).send_interval_minutes
+    remaining = max(0, int(max_responses) - (current_cnt + 1))
 
-        window_text = _fmt_wait_minutes(int(app.response_window_minutes))
-        # Keep Progress in sync (for status UI + "one active task" guard)
-        if prog.pending_post_id == post.id:
+    # if this was the last allowed answer -> close and schedule next from close time
+    if remaining == 0:
+        close_run_now(db, run_id=run.id, now=now, commit=False)
+        prog = db.scalar(select(Progress).where(Progress.user_id == user.id))
+        if prog:
+            prog.active_post_id = None
+            prog.active_started_at = None
+            prog.active_until = None
             prog.pending_post_id = None
-        prog.active_post_id = post.id
-        prog.active_started_at = now
-        prog.active_until = until
-        prog.updated_at = dt.datetime.now()
-        db.commit()
+            prog.next_send_at = _floor_to_minute(now) + dt.timedelta(minutes=interval)
+            prog.updated_at = dt.datetime.now()
+    # One commit for the answer and, on the last one, the close + reschedule.
+    db.commit()
+    return post.id, remaining, interval
 
-        # render day number procedurally (position)
-        text = (
-            f"<b>День {post.position}. {_h(post.title)}</b>\n\n"
-            f"{post.text_html}\n\n"
-            f"<b>Важно:</b> у вас есть <b>{window_text}</b> на выполнение задания с момента нажатия кнопки.\n"
-            f"Можно отправить до <b>{settings.max_responses_per_task}</b> сообщений."
-        )
 
-        # remove keyboard from previous message
-        try:
-            await call.message.edit_reply_markup(reply_markup=None)
-        except Exception:
-            pass
-
-        # check for default image if no file_id is set
-        media = None
-        is_local_file = False
-        if post.media_type == "photo" and post.file_id:
-            media = post.file_id
-        else:
-            # try local file by day number
-            local_path = f"data/images/{post.position}.png"
-            if os.path.exists(local_path):
-                media = FSInputFile(local_path)
-                is_local_file = True
-
-        # send media if found
-        if media:
-            try:
-                sent_msg = await call.message.answer_photo(photo=media, caption=text, request_timeout=120)
-                # If it was a local file and sent successfully, save the file_id to the DB for future use
-                if is_local_file and sent_msg.photo:
-                    post.file_id = sent_msg.photo[-1].file_id
-                    post.media_type = "photo"
-                    db.commit()
-            except Exception as e:
-                import logging
-                logging.getLogger(__name__).error("Failed to send photo for post %s: %s", post.id, e)
-                await call.message.answer(text, disable_web_page_preview=True)
-        else:
-            await call.message.answer(text, disable_web_page_preview=True)
-    finally:
-        db.close()
+async def _reply_answer_recorded(message: Message, post_id: int, remaining: int, interval: int) -> None:
+    interval_text = _fmt_wait_minutes(interval)
+    if remaining == 0:
+        await message.answer(
+            f"Спасибо! Ваш ответ записан.\n"
+            f"Задание закрыто.\n"
+            f"Следующее задание станет доступным через {interval_text}.",
+            parse_mode=None,
+        )
+        return
+    await message.answer(
+        f"Спасибо! Ваш ответ записан.\n"
+        f"Можно отправить ещё {remaining} сообщ.\n"
+        f"Следующее задание станет доступным через {interval_text} после завершения задания. Если задание завершено — нажмите кнопку ниже.",
+        reply_markup=task_done_kb(post_id=post_id),
+        parse_mode=None,
+    )
 
 
 @router.message(F.chat.type == "private", NotCommand(), StateFilter(None), ~F.reply_to_message)
@@ -535,80 +628,30 @@ async def capture_user_answer(message: Message, settings: Settings, session_fact
     if not txt:
         return
 
-    now = _tznow(settings)
-    db = session_factory()
-    try:
-        user = get_user_by_telegram_id(db, message.from_user.id)
-        if not user:
-            return
-
-        # 1) If user replied to a bot question message, route to that day
-        target_run = None
-        if message.reply_to_message and message.reply_to_message.from_user and message.reply_to_message.from_user.is_bot:
-            replied_text = (message.reply_to_message.text or message.reply_to_message.caption or "").strip()
-            # expecting "День X." at the beginning
-            import re
-
-            m = re.match(r"^День\s+(\d+)", replied_text)
-            if m:
-                pos = int(m.group(1))
-                post = get_post_by_position(db, position=pos)
-                if post:
-                    target_run = get_latest_open_run_for_post(db, user_id=user.id, post_id=post.id, now=now)
-
-        # 2) Otherwise: latest open task
-        if not target_run:
-            target_run = get_latest_open_run(db, user_id=user.id, now=now)
-
-        if not target_run:
-            return
-
-        # limit to 3 messages per task run
-        current_cnt = count_responses_for_run(db, run_id=target_run.id)
-        if current_cnt >= settings.max_responses_per_task:
-            # silently close when limit reached
-            close_run_now(db, run_id=target_run.id, now=now)
-            return
-
-        post = get_post(db, target_run.post_id)
-        if not post:
-            return
-
-        add_response(db, run_id=target_run.id, user_id=user.id, post_id=post.id, text=txt)
-
-        app = get_app_settings(db)
-        interval_text = _fmt_wait_minutes(int(app.send_interval_minutes))
-        remaining = max(0, int(settings.max_responses_per_task) - (current_cnt + 1))
-
-        # if this was the last allowed answer -> close and schedule next from close time
-        if current_cnt + 1 >= settings.max_responses_per_task:
-            close_run_now(db, run_id=target_run.id, now=now)
-            prog = db.scalar(select(Progress).where(Progress.user_id == user.id))
-            if prog:
-                prog.active_post_id = None
-                prog.active_started_at = None
-                prog.active_until = None
-                prog.pending_post_id = None
-                prog.next_send_at = _floor_to_minute(now) + dt.timedelta(minutes=int(app.send_interval_minutes))
-                prog.updated_at = dt.datetime.now()
-                db.commit()
-            await message.answer(
-                f"Спасибо! Ваш ответ записан.\n"
-                f"Задание закрыто.\n"
-                f"Следующее задание станет доступным через {interval_text}.",
-                parse_mode=None,
-            )
-            return
-
-        await message.answer(
-            f"Спасибо! Ваш ответ записан.\n"
-            f"Можно отправить ещё {remaining} сообщ.\n"
-            f"Следующее задание станет доступным через {interval_text} после завершения задания. Если задание завершено — нажмите кнопку ниже.",
-            reply_markup=task_done_kb(post_id=post.id),
-            parse_mode=None,
-        )
-    finally:
-        db.close()
+    # 1) If user replied to a bot question message, route to that day
+    pos = None
+    if message.reply_to_message and message.reply_to_message.from_user and message.reply_to_message.from_user.is_bot:
+        replied_text = (message.reply_to_message.text or message.reply_to_message.caption or "").strip()
+        # expecting "День X." at the beginning
+        import re
+
+        m = re.match(r"^День\s+(\d+)", replied_text)
+        if m:
+            pos = int(m.group(1))
+
+    # 2) Otherwise: latest open task
+    recorded = await run_db(
+        session_factory,
+        _record_answer,
+        telegram_id=message.from_user.id,
+        position=pos,
+        text=txt,
+        now=_tznow(settings),
+        max_responses=settings.max_responses_per_task,
+        fallback_to_latest=True,
+    )
+    if recorded:
+        await _reply_answer_recorded(message, *recorded)
 
 
 @router.message(F.chat.type == "private", NotCommand(), F.reply_to_message)
@@ -633,116 +676,78 @@ async def capture_user_answer_reply_always(message: Message, settings: Settings,
     if not txt:
         return
 
-    pos = int(m.group(1))
-    now = _tznow(settings)
-    db = session_factory()
-    try:
-        user = get_user_by_telegram_id(db, message.from_user.id)
-        if not user:
-            return
-        post = get_post_by_position(db, position=pos)
-        if not post:
-            return
-        run = get_latest_open_run_for_post(db, user_id=user.id, post_id=post.id, now=now)
-        if not run:
-            return
-        current_cnt = count_responses_for_run(db, run_id=run.id)
-        if current_cnt >= settings.max_responses_per_task:
-            close_run_now(db, run_id=run.id, now=now)
-            return
-        add_response(db, run_id=run.id, user_id=user.id, post_id=post.id, text=txt)
-
-        app = get_app_settings(db)
-        interval_text = _fmt_wait_minutes(int(app.send_interval_minutes))
-        remaining = max(0, int(settings.max_responses_per_task) - (current_cnt + 1))
-
-        if current_cnt + 1 >= settings.max_responses_per_task:
-            close_run_now(db, run_id=run.id, now=now)
-            prog = db.scalar(select(Progress).where(Progress.user_id == user.id))
-            if prog:
-                prog.active_post_id = None
-                prog.active_started_at = None
-                prog.active_until = None
-                prog.pending_post_id = None
-                prog.next_send_at = _floor_to_minute(now) + dt.timedelta(minutes=int(app.send_interval_minutes))
-                prog.updated_at = dt.datetime.now()
-                db.commit()
-            await message.answer(
-                f"Спасибо! Ваш ответ записан.\n"
-                f"Задание закрыто.\n"
-                f"Следующее задание станет доступным через {interval_text}.",
-                parse_mode=None,
-            )
-            return
+    recorded = await run_db(
+        session_factory,
+        _record_answer,
+        telegram_id=message.from_user.id,
+        position=int(m.group(1)),
+        text=txt,
+        now=_tznow(settings),
+        max_responses=settings.max_responses_per_task,
+        fallback_to_latest=False,
+    )
+    if recorded:
+        await _reply_answer_recorded(message, *recorded)
 
-        await message.answer(
-            f"Спасибо! Ваш ответ записан.\n"
-            f"Можно отправить ещё {remaining} сообщ.\n"
-            f"Следующее задание станет доступным через {interval_text} после завершения задания. Если задание завершено — нажмите кнопку ниже.",
-            reply_markup=task_done_kb(post_id=post.id),
-            parse_mode=None,
-        )
-    finally:
-        db.close()
+
+def _close_task(db, *, telegram_id: int, post_id: int, now: dt.datetime):
+    """
+    Close the user's open run for `post_id` early. Returns (status, send_interval_minutes)
+    where status is "no_user", "no_run" or "closed".
+    """
+    user = get_user_by_telegram_id(db, telegram_id)
+    if not user:
+        return "no_user", None
+    interval = get_app_settings_snapshot(db).send_interval_minutes
+
+    run = get_latest_open_run_for_post(db, user_id=user.id, post_id=post_id, now=now)
+    if not run:
+        return "no_run", interval
+
+    close_run_now(db, run_id=run.id, now=now, commit=False)
+    prog = db.scalar(select(Progress).where(Progress.user_id == user.id))
+    if prog:
+        if prog.active_post_id == post_id:
+            prog.active_post_id = None
+            prog.active_started_at = None
+            prog.active_until = None
+        prog.pending_post_id = None
+        prog.next_send_at = _floor_to_minute(now) + dt.timedelta(minutes=interval)
+        prog.updated_at = dt.datetime.now()
+    db.commit()
+    return "closed", interval
 
 
-@router.callback_query(F.data.startswith("task:done:"))
-async def task_done_callback(call: CallbackQuery, settings: Settings, session_factory):
+@router.callback_query(TaskCB.filter(F.action == "done"))
+async def task_done_callback(call: CallbackQuery, callback_data: TaskCB, settings: Settings, session_factory):
     if not call.from_user:
         return
-    post_id = int(call.data.split(":", 2)[2])
-    now = _tznow(settings)
-    now_min = _floor_to_minute(now)
-
-    db = session_factory()
-    try:
-        user = get_user_by_telegram_id(db, call.from_user.id)
-        if not user:
-            await call.answer("Пользователь не найден", show_alert=True)
-            return
-        app = get_app_settings(db)
-        interval_text = _fmt_wait_minutes(int(app.send_interval_minutes))
-
-        run = get_latest_open_run_for_post(db, user_id=user.id, post_id=post_id, now=now)
-        if not run:
-            await call.answer("Задание уже закрыто или окно ответа истекло.", show_alert=True)
-            return
-
-        close_run_now(db, run_id=run.id, now=now)
-        prog = db.scalar(select(Progress).where(Progress.user_id == user.id))
-        if prog:
-            if prog.active_post_id == post_id:
-                prog.active_post_id = None
-                prog.active_started_at = None
-                prog.active_until = None
-            prog.pending_post_id = None
-            prog.next_send_at = now_min + dt.timedelta(minutes=int(app.send_interval_minutes))
-            prog.updated_at = dt.datetime.now()
-            db.commit()
+    status, interval = await run_db(
+        session_factory, _close_task, telegram_id=call.from_user.id, post_id=callback_data.post_id, now=_tznow(settings)
+    )
+    if status == "no_user":
+        await call.answer("Пользователь не найден", show_alert=True)
+        return
+    if status == "no_run":
+        await call.answer("Задание уже закрыто или окно ответа истекло.", show_alert=True)
+        return
 
-        await call.message.answer(
-            f"✅ Готово! Задание закрыто.\n"
-            f"Следующее задание станет доступным через {interval_text}.",
-            parse_mode=None,
-        )
-        await call.answer()
-    finally:
-        db.close()
+    await call.message.answer(
+        f"✅ Готово! Задание закрыто.\n"
+        f"Следующее задание станет доступным через {_fmt_wait_minutes(interval)}.",
+        parse_mode=None,
+    )
+    await call.answer()
 
 
 @router.callback_query(F.data == "summary:show")
 async def show_summary(call: CallbackQuery, settings: Settings, session_factory):
     if not call.from_user:
         return
-    db = session_factory()
-    try:
-        user = get_user_by_telegram_id(db, call.from_user.id)
-        if not user:
-            await call.answer("Пользователь не найден", show_alert=True)
-            return
-        items = get_responses_for_user(db, user_id=user.id)
-    finally:
-        db.close()
+    items = await run_db(session_factory, _load_user_summary, telegram_id=call.from_user.id)
+    if items is None:
+        await call.answer("Пользователь не найден", show_alert=True)
+        return
 
     if not items:
         await call.message.answer("Пока нет заданий или ответов.")
@@ -750,30 +755,24 @@ async def show_summary(call: CallbackQuery, settings: Settings, session_factory)
         return
 
     await call.message.answer("Ваши ответы по дням", disable_web_page_preview=True, parse_mode=None)
-    for post, responses in items:
-        await _send_summary_item(call.message, post=post, responses=responses, truncate_to=500)
+    await _send_summary_items(call.message, items, truncate_to=500)
     await call.answer()
 
 
-@router.callback_query(F.data.startswith("summary:full:"))
-async def show_summary_full(call: CallbackQuery, settings: Settings, session_factory):
+@router.callback_query(SummaryFullCB.filter(F.cmd == "full"))
+async def show_summary_full(call: CallbackQuery, callback_data: SummaryFullCB, settings: Settings, session_factory):
     if not call.from_user:
         return
-    post_id = int(call.data.split(":", 2)[2])
-    db = session_factory()
-    try:
-        user = get_user_by_telegram_id(db, call.from_user.id)
-        if not user:
-            await call.answer("Пользователь не найден", show_alert=True)
-            return
-        items = get_responses_for_user(db, user_id=user.id)
-        found = None
-        for post, responses in items:
-            if post.id == post_id:
-                found = (post, responses)
-                break
-    finally:
-        db.close()
+    post_id = callback_data.post_id
+    items = await run_db(session_factory, _load_user_summary, telegram_id=call.from_user.id)
+    if items is None:
+        await call.answer("Пользователь не найден", show_alert=True)
+        return
+    found = None
+    for post, responses in items:
+        if post.id == post_id:
+            found = (post, responses)
+            break
 
     if not found:
         await call.answer("Не найдено", show_alert=True)
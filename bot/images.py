@@ -0,0 +1,32 @@
+import os
+from functools import lru_cache
+
+DEFAULT_IMAGES_DIR = "data/images"
+
+
+@lru_cache(maxsize=1)
+def _default_image_files() -> dict[int, str]:
+    """
+    Day number -> bundled `data/images/<day>.png` file name, scanned once per process
+    (images ship with the deployment; a restart picks up new ones).
+    """
+    try:
+        names = sorted(os.listdir(DEFAULT_IMAGES_DIR))
+    except OSError:
+        return {}
+    files: dict[int, str] = {}
+    for n in names:
+        stem = n[:-4]
+        if not (n.endswith(".png") and stem.isdigit()):
+            continue
+        # "1.png" wins over a zero-padded "01.png" for the same day.
+        if stem == str(int(stem)) or int(stem) not in files:
+            files[int(stem)] = n
+    return files
+
+
+def default_image_path(position: int) -> str | None:
+    name = _default_image_files().get(position)
+    if name is None:
+        return None
+    return f"{DEFAULT_IMAGES_DIR}/{name}"
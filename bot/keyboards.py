@@ -1,40 +1,115 @@
+from functools import lru_cache, wraps
+
+from aiogram.filters.callback_data import CallbackData
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 
+# Typed callback payloads. Packed strings keep the historical
+# "admin:<cmd>:...", "task:<action>:..." layouts, so buttons in already-sent
+# messages keep working.
+class AdminListCB(CallbackData, prefix="admin"):
+    """admin:list:<page>"""
+
+    cmd: str
+    page: int
+
+
+class AdminPostCB(CallbackData, prefix="admin"):
+    """admin:<edit|del|edit_title|edit_text|edit_media>:<post_id>:<page>"""
+
+    cmd: str
+    post_id: int
+    page: int
+
+
+class AdminMoveCB(CallbackData, prefix="admin"):
+    """admin:move:<up|down>:<post_id>:<page>"""
+
+    cmd: str
+    direction: str
+    post_id: int
+    page: int
+
+
+class TaskCB(CallbackData, prefix="task"):
+    """task:<start|done>:<post_id>"""
+
+    action: str
+    post_id: int
+
+
+class SummaryFullCB(CallbackData, prefix="summary"):
+    """summary:full:<post_id>"""
+
+    cmd: str
+    post_id: int
+
+
+def _cached_keyboard(maxsize: int):
+    """
+    Cache a keyboard builder's button data as plain (text, callback_data) tuples and
+    assemble a fresh InlineKeyboardMarkup per call: pydantic markups are mutable, so a
+    shared instance could be changed under every later caller.
+    """
+
+    def decorator(build):
+        @lru_cache(maxsize=maxsize)
+        def rows(**kwargs) -> tuple[tuple[tuple[str, str], ...], ...]:
+            return tuple(tuple((b.text, b.callback_data) for b in row) for row in build(**kwargs).inline_keyboard)
+
+        @wraps(build)
+        def wrapper(**kwargs) -> InlineKeyboardMarkup:
+            return InlineKeyboardMarkup(
+                inline_keyboard=[
+                    [InlineKeyboardButton(text=text, callback_data=data) for text, data in row] for row in rows(**kwargs)
+                ]
+            )
+
+        return wrapper
+
+    return decorator
+
+
+@_cached_keyboard(maxsize=256)
 def start_task_kb(*, post_id: int) -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
-    kb.row(InlineKeyboardButton(text="Начать?", callback_data=f"task:start:{post_id}"))
+    kb.row(InlineKeyboardButton(text="Начать?", callback_data=TaskCB(action="start", post_id=post_id).pack()))
     return kb.as_markup()
 
 
+@_cached_keyboard(maxsize=256)
 def task_done_kb(*, post_id: int) -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
-    kb.row(InlineKeyboardButton(text="✅ Готово", callback_data=f"task:done:{post_id}"))
+    kb.row(InlineKeyboardButton(text="✅ Готово", callback_data=TaskCB(action="done", post_id=post_id).pack()))
     return kb.as_markup()
 
 
+@_cached_keyboard(maxsize=1)
 def summary_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.row(InlineKeyboardButton(text="Посмотреть мои ответы", callback_data="summary:show"))
     return kb.as_markup()
 
 
+@_cached_keyboard(maxsize=256)
 def summary_full_kb(*, post_id: int) -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
-    kb.row(InlineKeyboardButton(text="Показать полностью", callback_data=f"summary:full:{post_id}"))
+    kb.row(InlineKeyboardButton(text="Показать полностью", callback_data=SummaryFullCB(cmd="full", post_id=post_id).pack()))
     return kb.as_markup()
 
 
+@_cached_keyboard(maxsize=1)
 def onboarding_go_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.row(InlineKeyboardButton(text="ПОЕХАЛИ!", callback_data="onboarding:go"))
     return kb.as_markup()
 
 
+@_cached_keyboard(maxsize=1)
 def admins_menu_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
-    kb.row(InlineKeyboardButton(text="📋 Посты", callback_data="admin:list:0"))
+    kb.row(InlineKeyboardButton(text="📋 Посты", callback_data=AdminListCB(cmd="list", page=0).pack()))
     kb.row(InlineKeyboardButton(text="👋 Приветствие/финал", callback_data="admin:greeting_final"))
     kb.row(InlineKeyboardButton(text="⏱ Окно ответа", callback_data="admin:resp_window"))
     kb.row(InlineKeyboardButton(text="⏲ Интервал рассылки", callback_data="admin:send_interval"))
@@ -49,6 +124,7 @@ def admins_menu_kb() -> InlineKeyboardMarkup:
     return kb.as_markup()
 
 
+@_cached_keyboard(maxsize=1)
 def admin_broadcast_confirm_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.row(
@@ -58,6 +134,7 @@ def admin_broadcast_confirm_kb() -> InlineKeyboardMarkup:
     return kb.as_markup()
 
 
+@_cached_keyboard(maxsize=1)
 def admin_greeting_final_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.row(InlineKeyboardButton(text="✉️ Приветствие (текст)", callback_data="admin:greeting"))
@@ -68,9 +145,10 @@ def admin_greeting_final_kb() -> InlineKeyboardMarkup:
     return kb.as_markup()
 
 
-def admins_posts_list_kb(*, posts: list[tuple[int, int, str]], page: int, page_size: int, total: int) -> InlineKeyboardMarkup:
+@_cached_keyboard(maxsize=64)
+def admins_posts_list_kb(*, posts: tuple[tuple[int, int, str], ...], page: int, page_size: int, total: int) -> InlineKeyboardMarkup:
     """
-    posts: list of (post_id, position, title)
+    posts: tuple of (post_id, position, title); a tuple so identical pages hit the cache
     Row: [Day+Title] [⬆️] [⬇️] [❌]
     """
     kb = InlineKeyboardBuilder()
@@ -80,49 +158,57 @@ def admins_posts_list_kb(*, posts: list[tuple[int, int, str]], page: int, page_s
         kb.row(
             InlineKeyboardButton(
                 text=f"День {position}. {title}",
-                callback_data=f"admin:edit:{post_id}:{page}",
+                callback_data=AdminPostCB(cmd="edit", post_id=post_id, page=page).pack(),
             )
         )
         kb.row(
-            InlineKeyboardButton(text="⬆️", callback_data=f"admin:move:up:{post_id}:{page}"),
-            InlineKeyboardButton(text="⬇️", callback_data=f"admin:move:down:{post_id}:{page}"),
-            InlineKeyboardButton(text="❌", callback_data=f"admin:del:{post_id}:{page}"),
+            InlineKeyboardButton(
+                text="⬆️", callback_data=AdminMoveCB(cmd="move", direction="up", post_id=post_id, page=page).pack()
+            ),
+            InlineKeyboardButton(
+                text="⬇️", callback_data=AdminMoveCB(cmd="move", direction="down", post_id=post_id, page=page).pack()
+            ),
+            InlineKeyboardButton(text="❌", callback_data=AdminPostCB(cmd="del", post_id=post_id, page=page).pack()),
         )
 
     nav = InlineKeyboardBuilder()
     max_page = max(0, (total - 1) // page_size) if total else 0
     if page > 0:
-        nav.add(InlineKeyboardButton(text="⬅️", callback_data=f"admin:list:{page-1}"))
+        nav.add(InlineKeyboardButton(text="⬅️", callback_data=AdminListCB(cmd="list", page=page - 1).pack()))
     nav.add(InlineKeyboardButton(text=f"{page+1}/{max_page+1}", callback_data="noop"))
     if page < max_page:
-        nav.add(InlineKeyboardButton(text="➡️", callback_data=f"admin:list:{page+1}"))
+        nav.add(InlineKeyboardButton(text="➡️", callback_data=AdminListCB(cmd="list", page=page + 1).pack()))
     kb.row(*nav.buttons)
 
     kb.row(InlineKeyboardButton(text="⬅️ Назад", callback_data="admin:menu"))
     return kb.as_markup()
 
 
+@_cached_keyboard(maxsize=256)
 def admin_edit_post_kb(*, post_id: int, page: int) -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
-    kb.row(InlineKeyboardButton(text="✏️ Название", callback_data=f"admin:edit_title:{post_id}:{page}"))
-    kb.row(InlineKeyboardButton(text="✏️ Текст", callback_data=f"admin:edit_text:{post_id}:{page}"))
-    kb.row(InlineKeyboardButton(text="🖼 Картинка", callback_data=f"admin:edit_media:{post_id}:{page}"))
-    kb.row(InlineKeyboardButton(text="⬅️ К списку", callback_data=f"admin:list:{page}"))
+    kb.row(InlineKeyboardButton(text="✏️ Название", callback_data=AdminPostCB(cmd="edit_title", post_id=post_id, page=page).pack()))
+    kb.row(InlineKeyboardButton(text="✏️ Текст", callback_data=AdminPostCB(cmd="edit_text", post_id=post_id, page=page).pack()))
+    kb.row(InlineKeyboardButton(text="🖼 Картинка", callback_data=AdminPostCB(cmd="edit_media", post_id=post_id, page=page).pack()))
+    kb.row(InlineKeyboardButton(text="⬅️ К списку", callback_data=AdminListCB(cmd="list", page=page).pack()))
     return kb.as_markup()
 
 
+@_cached_keyboard(maxsize=256)
 def admin_cancel_edit_post_kb(*, post_id: int, page: int) -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
-    kb.row(InlineKeyboardButton(text="❌ Отмена", callback_data=f"admin:edit:{post_id}:{page}"))
+    kb.row(InlineKeyboardButton(text="❌ Отмена", callback_data=AdminPostCB(cmd="edit", post_id=post_id, page=page).pack()))
     return kb.as_markup()
 
 
+@_cached_keyboard(maxsize=1)
 def admin_cancel_greeting_final_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.row(InlineKeyboardButton(text="❌ Отмена", callback_data="admin:greeting_final"))
     return kb.as_markup()
 
 
+@_cached_keyboard(maxsize=1)
 def admin_cancel_menu_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.row(InlineKeyboardButton(text="❌ Отмена", callback_data="admin:menu"))
@@ -5,7 +5,7 @@ from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
-from bot.admin_handlers import admin_router
+from bot.admin_handlers import admin_denied_router, admin_router
 from bot.config import load_settings
 from bot.db import init_db, make_engine, make_session_factory
 from bot.handlers import router as user_router
@@ -22,7 +22,9 @@ async def main() -> None:
     os.makedirs("bot_data", exist_ok=True)
 
     settings = load_settings()
-    engine = make_engine(settings.database_url)
+    engine = make_engine(
+        settings.database_url, pool_size=settings.db_pool_size, max_overflow=settings.db_max_overflow
+    )
     init_db(engine)
     session_factory = make_session_factory(engine)
 
@@ -50,6 +52,7 @@ async def main() -> None:
 
     dp.include_router(user_router)
     dp.include_router(admin_router)
+    dp.include_router(admin_denied_router)
 
     scheduler = setup_scheduler(bot=bot, session_factory=session_factory, settings=settings)
     dp["scheduler"] = scheduler
@@ -62,6 +65,11 @@ async def main() -> None:
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        import uvloop
+    except ImportError:  # optional speedup (not available on Windows)
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
 
 
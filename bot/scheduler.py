@@ -1,8 +1,6 @@
 import asyncio
 import datetime as dt
-import html
 import logging
-from zoneinfo import ZoneInfo
 
 from aiogram import Bot
 from aiogram.enums import ParseMode
@@ -13,8 +11,9 @@ from sqlalchemy import select, text
 from sqlalchemy.orm import Session
 
 from bot.config import Settings
-from bot.db import Post, Progress, User, TaskRun, count_posts, get_app_settings, get_post_by_position
+from bot.db import Post, Progress, User, TaskRun, count_posts, get_app_settings_snapshot, get_post_by_position
 from bot.keyboards import start_task_kb, summary_kb
+from bot.text_utils import escape_html
 
 logger = logging.getLogger(__name__)
 _TICK_LOCK = asyncio.Lock()
@@ -23,14 +22,14 @@ _TICK_LOCK = asyncio.Lock()
 def _tznow(settings: Settings) -> dt.datetime:
     # Store/compare all timestamps as tz-naive "local time" in settings.tz
     # to avoid naive/aware comparison issues with SQLite.
-    return dt.datetime.now(ZoneInfo(settings.tz)).replace(tzinfo=None)
+    return dt.datetime.now(settings.tzinfo).replace(tzinfo=None)
 
 def _floor_to_minute(t: dt.datetime) -> dt.datetime:
     return t.replace(second=0, microsecond=0)
 
 
 async def _send_task_notification(bot: Bot, *, chat_id: int, post: Post) -> None:
-    safe_title = html.escape(post.title or "")
+    safe_title = escape_html(post.title or "")
     text_html = f"Вы получили сегодняшнее задание — <b>{safe_title}</b>\n\nНачать?"
     try:
         await bot.send_message(
@@ -125,8 +124,8 @@ async def tick(*, bot: Bot, session_factory, settings: Settings) -> None:
                 got = db.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": lock_key}).scalar()
                 if not got:
                     return
-            app = get_app_settings(db)
-            interval_min = int(app.send_interval_minutes)
+            app = get_app_settings_snapshot(db)
+            interval_min = app.send_interval_minutes
             max_posts = count_posts(db)
             # Join to users to skip those who haven't completed onboarding yet.
             rows = list(
@@ -166,9 +165,9 @@ async def tick(*, bot: Bot, session_factory, settings: Settings) -> None:
                                 await _send_summary_prompt(
                                     bot,
                                     chat_id=int(telegram_id),
-                                    text_value=str((getattr(app, "final_text", None) or "")).strip() or "Марафон завершён. Хотите посмотреть свои ответы?",
-                                    media_type=getattr(app, "final_media_type", None),
-                                    file_id=getattr(app, "final_file_id", None),
+                                    text_value=(app.final_text or "").strip() or "Марафон завершён. Хотите посмотреть свои ответы?",
+                                    media_type=app.final_media_type,
+                                    file_id=app.final_file_id,
                                 )
                                 p.summary_prompt_sent = True
                                 p.updated_at = dt.datetime.now()
@@ -236,7 +235,7 @@ async def tick(*, bot: Bot, session_factory, settings: Settings) -> None:
                         logger.exception(
                             "Failed to send task notification user_id=%s chat_id=%s post_id=%s",
                             p.user_id,
-                            chat_id,
+                            telegram_id,
                             post.id,
                         )
                         continue
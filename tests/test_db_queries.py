@@ -0,0 +1,52 @@
+import datetime as dt
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
+
+from bot.db import Base, Response, TaskRun, create_post, get_responses_for_user, make_session_factory, upsert_user
+
+
+@contextmanager
+def count_queries(engine):
+    statements: list[str] = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+
+
+def test_get_responses_for_user_is_one_query():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = make_session_factory(engine)()
+
+    posts = [create_post(db, title=f"p{i}", text_html="", media_type=None, file_id=None) for i in range(3)]
+    user = upsert_user(db, telegram_id=1)
+    started = dt.datetime(2024, 1, 1)
+    # Two runs for the first post (only the later one counts), one for the second, none for the third.
+    old, new, other = (
+        TaskRun(user_id=user.id, post_id=post.id, started_at=started + dt.timedelta(hours=h), until=started)
+        for post, h in ((posts[0], 0), (posts[0], 1), (posts[1], 0))
+    )
+    db.add_all([old, new, other])
+    db.flush()
+    db.add_all(
+        [
+            Response(run_id=old.id, user_id=user.id, post_id=posts[0].id, seq=1, text="old"),
+            Response(run_id=new.id, user_id=user.id, post_id=posts[0].id, seq=1, text="new"),
+            Response(run_id=other.id, user_id=user.id, post_id=posts[1].id, seq=1, text="other"),
+        ]
+    )
+    db.commit()
+    db.expunge_all()
+
+    with count_queries(engine) as statements:
+        items = get_responses_for_user(db, user_id=user.id)
+
+    assert len(statements) == 1 and statements[0].lstrip().upper().startswith("SELECT")
+    assert [(p.title, [r.text for r in rs]) for p, rs in items] == [("p0", ["new"]), ("p1", ["other"]), ("p2", [])]